@@ -100,7 +100,7 @@ def did_you_mean(eng_dict, word):
     Return a list of possible correct words that are "near" to the
     current word.
     '''
-    fv = []  # trie.fuzzy_versions(t, word)
+    fv = eng_dict.fuzzy_versions(word, nearby=nearby_keys)
     if len(fv) == 0:
         return
     if len(fv) <= 20:
@@ -130,13 +130,18 @@ def prompt(message, word):
     sys.stdout.flush()
 
 
-def process_completions(eng_dict, message, word, print_candidates):
+def process_completions(eng_dict, message, word, print_candidates,
+                        cursor=None):
     '''
     Process the current "word" and generate a new message and prompt,
     information about possible completions, an error message, or
-    information about possible corrections to the word.
+    information about possible corrections to the word. If a cursor at
+    "word" is given, the number of completions is read from it.
     '''
-    n = eng_dict.num_completions(word)
+    if cursor is not None:
+        n = cursor.num_completions()
+    else:
+        n = eng_dict.num_completions(word)
     misspelled = False
 
     if n == 0:
@@ -157,12 +162,13 @@ def process_completions(eng_dict, message, word, print_candidates):
         prompt(message, word)
     else:
         if print_candidates:
+            # Only the 10 best candidates are generated, however many
+            # completions there are
+            print()
+            for com in eng_dict.top_completions(word, 10):
+                print(word + com)
             if n > 10:
-                print("\n(" + str(n) + " completions)")
-            else:
-                print()
-                for com in eng_dict.get_completions(word):
-                    print(word + com)
+                print("(" + str(n) + " completions)")
             prompt(message, word)
 
     return message, word, misspelled
@@ -177,6 +183,9 @@ def shell(eng_dict):
     '''
     message = ""
     word = ""
+    # Follows "word" one key at a time, so that each key press only
+    # moves one step in the trie
+    cursor = eng_dict.cursor()
     misspelled = False
     prompt(message, word)
     while True:
@@ -187,6 +196,7 @@ def shell(eng_dict):
         if ord(c) == 4:
             message = ""
             word = ""
+            cursor.reset()
             misspelled = False
             print()
             prompt(message, word)
@@ -197,7 +207,7 @@ def shell(eng_dict):
             if misspelled:
                 misspelled_prompt(message, eng_dict, word)
             else:
-                if not eng_dict.is_word(word):
+                if not cursor.is_word():
                     print("\nWord '%s' does not exist" % word)
                     did_you_mean(eng_dict, word)
                     prompt(message, word)
@@ -206,6 +216,7 @@ def shell(eng_dict):
                         message += " "
                     message += word
                     word = ""
+                    cursor.reset()
                     print()
                     prompt(message, word)
 
@@ -214,7 +225,9 @@ def shell(eng_dict):
         # Autocomplete
         if c == "\t":
             if word != "":
-                message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=True)
+                message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=True, cursor=cursor)
+                if word == "":
+                    cursor.reset()
             continue
 
         # Backspace
@@ -223,6 +236,7 @@ def shell(eng_dict):
                 print("cannot change previous word once accepted")
                 continue
             word = word[:len(word) - 1]
+            cursor.back()
             sys.stdout.write('\r')
             sys.stdout.flush()
             prompt(message, word + " ")
@@ -239,13 +253,18 @@ def shell(eng_dict):
             sys.stdout.write(c)
             sys.stdout.flush()
             word = word + c
+            cursor.advance(c)
 
-        message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=False)
+        message, word, misspelled = process_completions(eng_dict, message, word, print_candidates=False, cursor=cursor)
+        if word == "":
+            cursor.reset()
 
 
-def go(module_name=None):
+def go(module_name=None, backend=None):
     '''
-    Process the arguments and fire up the shell.
+    Process the arguments and fire up the shell. If a backend is given,
+    it is passed on to the module's EnglishDictionary, and so is the
+    optional frequency file used to rank completions.
     '''
 
     global module
@@ -254,8 +273,9 @@ def go(module_name=None):
     if module_name:
         module = __import__(module_name)
 
-    if(len(sys.argv) != 2):
-        print("Usage: python3 english_dictionary.py WORD_FILE")
+    if(len(sys.argv) not in (2, 3)):
+        print("Usage: python3 english_dictionary.py WORD_FILE "
+              "[FREQUENCY_FILE]")
         exit(1)
 
     wordfile = sys.argv[1]
@@ -265,7 +285,13 @@ def go(module_name=None):
         exit(1)
 
     print("Loading words into trie...",)
-    eng_dict = module.EnglishDictionary(wordfile)
+    options = {}
+    if len(sys.argv) == 3:
+        options["frequencyfile"] = sys.argv[2]
+    if backend:
+        eng_dict = module.EnglishDictionary(wordfile, backend, **options)
+    else:
+        eng_dict = module.EnglishDictionary(wordfile, **options)
     print(" done")
     print("===================================================")
     print("      Welcome to the auto-completing shell!")
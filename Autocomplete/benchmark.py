@@ -0,0 +1,426 @@
+# CS122: Auto-completing keyboard using Tries
+# Benchmarks for the dictionary backends
+#
+
+import os
+import sys
+import time
+import random
+import asyncio
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+
+import english_dictionary
+import autocorrect_shell
+import completion_server
+
+NUM_WORDS = 200000
+NUM_QUERIES = 20000
+SYLLABLES = ["a", "an", "ar", "be", "ca", "co", "de", "di", "el", "en",
+             "er", "fa", "ge", "in", "la", "le", "ma", "mi", "no", "or",
+             "pa", "pre", "re", "ro", "sa", "se", "st", "ta", "te", "ti",
+             "to", "tr", "un", "ve"]
+SUFFIXES = ["", "", "", "s", "ed", "er", "ing", "ly", "ness", "tion"]
+NUM_TYPOS = 100
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+SERVER_CLIENTS = 100
+PERCENTILES = [50, 99]
+# Share of each command in the requests sent to the server
+SERVER_MIX = [("is_word", 40), ("num_completions", 40),
+              ("get_completions", 10), ("top_completions", 5),
+              ("fuzzy_versions", 5)]
+
+
+def make_words(n, seed=0):
+    '''
+    Build a list of n distinct synthetic words, made of syllables and
+    common suffixes so that they share prefixes and suffixes like real
+    words do
+
+    Inputs:
+        n (int): number of words
+        seed (int): seed for the random generator
+
+    Returns:
+        list of strings
+    '''
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        stem = "".join(rng.choice(SYLLABLES)
+                       for _ in range(rng.randint(1, 5)))
+        words.add(stem + rng.choice(SUFFIXES))
+    words = list(words)
+    rng.shuffle(words)
+    return words
+
+
+def word_file(arg):
+    '''
+    Returns the name of the word file to use: arg itself if it is not a
+    number, otherwise a temporary file with that many synthetic words
+    '''
+    if not arg.isdigit():
+        return arg
+
+    f = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+    with f:
+        f.write("\n".join(make_words(int(arg))) + "\n")
+    return f.name
+
+
+def max_rss_kib():
+    '''
+    Peak resident set size of this process in KiB
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure_load(backend, wordfile):
+    '''
+    Load a dictionary and print how long it took and how much the peak
+    RSS of this process grew while loading, then load it again with
+    tracemalloc on to print how much memory the dictionary keeps once
+    loaded (freed memory is not always given back to the system, so the
+    RSS does not tell). Runs in its own process, so that every backend
+    starts from the same memory use.
+    '''
+    before = max_rss_kib()
+    start = time.perf_counter()
+    eng_dict = english_dictionary.EnglishDictionary(wordfile, backend)
+    seconds = time.perf_counter() - start
+    peak = max_rss_kib() - before
+    del eng_dict
+
+    tracemalloc.start()
+    eng_dict = english_dictionary.EnglishDictionary(wordfile, backend)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(seconds, peak, size // 1024)
+
+
+def compare_load(wordfile):
+    '''
+    Print the load time, peak RSS growth and size of every dictionary
+    backend
+    '''
+    print("loading {}".format(wordfile))
+    print("  {:8} {:>10} {:>16} {:>16}".format("backend", "seconds",
+                                               "peak RSS (MiB)",
+                                               "size (MiB)"))
+
+    # A child process starts with the peak RSS of its parent, so the
+    # parent never loads a dictionary itself
+    def measure(backend):
+        output = subprocess.run([sys.executable, __file__, "measure",
+                                 backend, wordfile], capture_output=True,
+                                text=True, check=True).stdout
+        return output.split()
+
+    # Build the index of the mapped backend, so that only opening it is
+    # measured
+    measure("mapped")
+
+    for backend in english_dictionary.BACKENDS:
+        seconds, peak, rss = measure(backend)
+        print("  {:8} {:10.3f} {:16.1f} {:16.1f}".format(
+            backend, float(seconds), int(peak) / 1024, int(rss) / 1024))
+
+
+def compare_queries(wordfile):
+    '''
+    Print the time per query of is_word, num_completions,
+    get_completions and of getting the first 10 completions in order for
+    every dictionary backend
+    '''
+    words = english_dictionary.read_words(wordfile)
+    rng = random.Random(1)
+    queries = [rng.choice(words) for _ in range(NUM_QUERIES)]
+    prefixes = [w[:rng.randint(1, len(w))] for w in queries]
+    short = [w[:2] for w in queries]
+    tests = [("is_word", "is_word", queries),
+             ("num_completions", "num_completions", prefixes),
+             ("get_completions", "get_completions",
+              prefixes[:NUM_QUERIES // 20]),
+             ("first 10", "first_completions", short)]
+
+    print("time per query (us) on {}".format(wordfile))
+    print("  {:8} ".format("backend") +
+          " ".join("{:>16}".format(name) for name, _, _ in tests))
+
+    for backend in english_dictionary.BACKENDS:
+        eng_dict = english_dictionary.EnglishDictionary(wordfile, backend,
+                                                       cache_entries=0)
+        eng_dict.first_completions = lambda prefix: list(
+            eng_dict.iter_completions(prefix, limit=10, ordered=True))
+        times = []
+        for _, name, args in tests:
+            method = getattr(eng_dict, name)
+            start = time.perf_counter()
+            for arg in args:
+                method(arg)
+            times.append((time.perf_counter() - start) / len(args))
+        print("  {:8} ".format(backend) +
+              " ".join("{:16.2f}".format(t * 1e6) for t in times))
+
+
+def compare_ranking(wordfile):
+    '''
+    Print the time per query of the 10 most frequent completions of short
+    prefixes, with top_completions and by sorting every completion, for
+    the backends that support frequencies. Word frequencies follow
+    Zipf's law over a random order of the words.
+    '''
+    words = english_dictionary.read_words(wordfile)
+    rng = random.Random(2)
+    ranks = list(range(1, len(words) + 1))
+    rng.shuffle(ranks)
+    frequencies = {w: 10 ** 7 // rank for w, rank in zip(words, ranks)}
+    prefixes = [rng.choice(words)[:rng.randint(1, 3)]
+                for _ in range(NUM_QUERIES // 20)]
+
+    def sort_all(eng_dict, prefix):
+        completions = eng_dict.get_completions(prefix)
+        completions.sort(key=lambda c: (-frequencies.get(prefix + c, 0), c))
+        return completions[:10]
+
+    print("time per top 10 query (us) on {}".format(wordfile))
+    print("  {:8} {:>16} {:>16}".format("backend", "top_completions",
+                                        "sort all"))
+
+    for backend in english_dictionary.BACKENDS:
+        if backend == "dawg":
+            continue
+        eng_dict = english_dictionary.EnglishDictionary(wordfile, backend,
+                                                       cache_entries=0)
+        eng_dict.set_frequencies(frequencies)
+        times = []
+        for function in (lambda prefix: eng_dict.top_completions(prefix, 10),
+                         lambda prefix: sort_all(eng_dict, prefix)):
+            start = time.perf_counter()
+            for prefix in prefixes:
+                function(prefix)
+            times.append((time.perf_counter() - start) / len(prefixes))
+        print("  {:8} {:16.2f} {:16.2f}".format(backend, times[0] * 1e6,
+                                                times[1] * 1e6))
+
+
+def make_typo(word, rng):
+    '''
+    Returns word with one letter replaced, removed or inserted
+    '''
+    i = rng.randrange(len(word))
+    edit = rng.randrange(3)
+    if edit == 0:
+        return word[:i] + rng.choice(LETTERS) + word[i + 1:]
+    if edit == 1:
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice(LETTERS) + word[i:]
+
+
+def edit_distance(a, b):
+    '''
+    Levenshtein distance between two strings
+    '''
+    row = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        new_row = [i]
+        for j, y in enumerate(b, 1):
+            new_row.append(min(row[j] + 1, new_row[j - 1] + 1,
+                               row[j - 1] + (x != y)))
+        row = new_row
+    return row[-1]
+
+
+def compare_fuzzy(wordfile):
+    '''
+    Print the time per query of fuzzy_versions on misspelled words for
+    every dictionary backend and distance, and of comparing the word
+    with every word of the dictionary
+    '''
+    words = english_dictionary.read_words(wordfile)
+    rng = random.Random(3)
+    typos = [make_typo(rng.choice(words), rng) for _ in range(NUM_TYPOS)]
+    nearby = autocorrect_shell.nearby_keys
+
+    print("time per fuzzy query (ms) on {}".format(wordfile))
+    print("  {:8} {:>12} {:>12} {:>12}".format("backend", "distance 1",
+                                              "nearby keys", "distance 2"))
+
+    for backend in english_dictionary.BACKENDS:
+        eng_dict = english_dictionary.EnglishDictionary(wordfile, backend)
+        times = []
+        for distance, keys in ((1, None), (1, nearby), (2, None)):
+            start = time.perf_counter()
+            for typo in typos:
+                eng_dict.fuzzy_versions(typo, distance, keys)
+            times.append((time.perf_counter() - start) / len(typos))
+        print("  {:8} ".format(backend) +
+              " ".join("{:12.2f}".format(t * 1e3) for t in times))
+
+    start = time.perf_counter()
+    for typo in typos[:NUM_TYPOS // 20]:
+        [w for w in words if edit_distance(typo, w) <= 1]
+    seconds = (time.perf_counter() - start) / (NUM_TYPOS // 20)
+    print("  {:8} {:12.2f}".format("scan all", seconds * 1e3))
+
+
+def compare_cache(wordfile):
+    '''
+    Print the time per get_completions query with and without the
+    completion cache on a stream of short prefixes, where a few common
+    prefixes come up far more often than the others (Zipf's law)
+    '''
+    words = english_dictionary.read_words(wordfile)
+    rng = random.Random(4)
+    prefixes = sorted(set(w[:rng.randint(2, 3)] for w in words))
+    rng.shuffle(prefixes)
+    weights = [1 / rank for rank in range(1, len(prefixes) + 1)]
+    queries = rng.choices(prefixes, weights, k=NUM_QUERIES // 10)
+
+    print("time per get_completions query (us) on {}".format(wordfile))
+    print("  {:10} {:>12} {:>8} {:>8}".format("cache", "time", "hits",
+                                              "misses"))
+
+    for name, entries in (("none", 0),
+                          ("default", english_dictionary.CACHE_ENTRIES)):
+        eng_dict = english_dictionary.EnglishDictionary(
+            wordfile, "array", cache_entries=entries)
+        start = time.perf_counter()
+        for prefix in queries:
+            eng_dict.get_completions(prefix)
+        seconds = (time.perf_counter() - start) / len(queries)
+
+        stats = eng_dict.cache.stats() if eng_dict.cache else {}
+        print("  {:10} {:12.2f} {:>8} {:>8}".format(
+            name, seconds * 1e6, stats.get("hits", "-"),
+            stats.get("misses", "-")))
+
+
+def percentile(sorted_values, p):
+    '''
+    Returns the p-th percentile of an already sorted list
+    '''
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def make_requests(words, n, rng):
+    '''
+    Build n request lines for the completion server, with commands drawn
+    according to SERVER_MIX
+
+    Returns:
+        list of (command, bytes) pairs
+    '''
+    commands = [command for command, _ in SERVER_MIX]
+    weights = [weight for _, weight in SERVER_MIX]
+    requests = []
+
+    for command in rng.choices(commands, weights, k=n):
+        word = rng.choice(words)
+        if command == "is_word":
+            line = "is_word " + word
+        elif command == "num_completions":
+            line = "num_completions " + word[:rng.randint(1, len(word))]
+        elif command == "get_completions":
+            line = "get_completions " + word[:rng.randint(1, 3)] + " 10"
+        elif command == "top_completions":
+            line = "top_completions " + word[:rng.randint(1, 3)] + " 10"
+        else:
+            line = "fuzzy_versions " + make_typo(word, rng)
+        requests.append((command, (line + "\n").encode("utf-8")))
+
+    return requests
+
+
+async def load_server(eng_dict, requests, clients):
+    '''
+    Serve eng_dict on a free local port and send it the requests from
+    many clients at once, each sending its next request as soon as it
+    gets the answer to the previous one
+
+    Returns:
+        (seconds, dict mapping commands to lists of latencies)
+    '''
+    server = await completion_server.serve(eng_dict, port=0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = {command: [] for command, _ in SERVER_MIX}
+
+    async def client(requests):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for command, line in requests:
+            start = time.perf_counter()
+            writer.write(line)
+            await reader.readline()
+            latencies[command].append(time.perf_counter() - start)
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(requests[i::clients])
+                           for i in range(clients)))
+    seconds = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+    return seconds, latencies
+
+
+def compare_server(wordfile):
+    '''
+    Print the throughput of the completion server under SERVER_CLIENTS
+    concurrent clients, and the latency percentiles of each command. The
+    clients run in the same process as the server, so they share its
+    CPU time.
+    '''
+    words = english_dictionary.read_words(wordfile)
+    rng = random.Random(5)
+    requests = make_requests(words, NUM_QUERIES, rng)
+    eng_dict = english_dictionary.EnglishDictionary(wordfile, "array")
+
+    seconds, latencies = asyncio.run(load_server(eng_dict, requests,
+                                                 SERVER_CLIENTS))
+    print("{} requests from {} clients on {}: {:.0f} requests/s".format(
+        len(requests), SERVER_CLIENTS, wordfile, len(requests) / seconds))
+    print("  {:16} {:>8} ".format("command", "requests") +
+          " ".join("{:>10}".format("p{} (ms)".format(p))
+                   for p in PERCENTILES))
+
+    every = [value for values in latencies.values() for value in values]
+    for command, values in list(latencies.items()) + [("all", every)]:
+        values.sort()
+        if values:
+            print("  {:16} {:8} ".format(command, len(values)) +
+                  " ".join("{:10.2f}".format(percentile(values, p) * 1e3)
+                           for p in PERCENTILES))
+
+
+if __name__ == "__main__":
+    num_args = len(sys.argv)
+    modes = {"load": compare_load, "queries": compare_queries,
+             "ranking": compare_ranking, "fuzzy": compare_fuzzy,
+             "cache": compare_cache, "server": compare_server}
+
+    if num_args == 4 and sys.argv[1] == "measure":
+        measure_load(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    if num_args > 3 or (num_args > 1 and sys.argv[1] not in modes):
+        print("usage: python3 " + sys.argv[0] +
+              " [load|queries|ranking|fuzzy|cache|server] " +
+              "[<word file>|<number of synthetic words>]")
+        sys.exit(0)
+
+    mode = sys.argv[1] if num_args > 1 else "load"
+    arg = sys.argv[2] if num_args > 2 else str(NUM_WORDS)
+    wordfile = word_file(arg)
+    try:
+        modes[mode](wordfile)
+    finally:
+        if wordfile != arg:
+            os.remove(wordfile)
+            if os.path.exists(wordfile + ".idx"):
+                os.remove(wordfile + ".idx")
@@ -0,0 +1,320 @@
+# CS122: Auto-completing keyboard using Tries
+# Compact trie stored in flat arrays
+#
+
+import os
+import mmap
+import struct
+from array import array
+
+INDEX_MAGIC = b"TRIEIDX1"
+# magic, number of nodes, bytes per label, and the size and modification
+# time (in ns) of the word file the index was built from
+INDEX_HEADER = struct.Struct("=8sqqqq")
+
+
+class ArrayTrie(object):
+    '''
+    Trie with the same contents as a tree of TrieNodes, but stored in a
+    few flat arrays instead of one Python object (and one dict) per
+    character. Nodes are plain integers, numbered in breadth-first order
+    with node 0 as the root, so the children of every node are stored
+    next to each other:
+
+      labels[i]   letter on the edge into node i
+      first[i]    index of the first child of node i; its children are
+                  the nodes first[i] .. first[i + 1] - 1
+      counts[i]   number of words that go through node i
+      finals[i]   1 if a word ends at node i
+    '''
+
+    def __init__(self, words):
+        '''
+        Constructor
+
+        Inputs:
+          words (list of strings): the words, in any order and possibly
+            with duplicates
+        '''
+        words = sorted(set(words))
+
+        labels = ["\0"]
+        self.first = array("i")
+        self.counts = array("i", [len(words)])
+        self.finals = bytearray(1)
+
+        # Range of words below every node that has not been expanded yet
+        lows = array("i", [0])
+        highs = array("i", [len(words)])
+        depths = array("i", [0])
+
+        node = 0
+        while node < len(lows):
+            low, high, depth = lows[node], highs[node], depths[node]
+            self.first.append(len(lows))
+
+            # The word that ends here, if any, sorts before its extensions
+            if low < high and len(words[low]) == depth:
+                self.finals[node] = 1
+                low += 1
+
+            while low < high:
+                letter = words[low][depth]
+                end = low + 1
+                while end < high and words[end][depth] == letter:
+                    end += 1
+                labels.append(letter)
+                lows.append(low)
+                highs.append(end)
+                depths.append(depth + 1)
+                self.counts.append(end - low)
+                self.finals.append(0)
+                low = end
+
+            node += 1
+
+        self.first.append(len(lows))
+        self.labels = "".join(labels)
+
+    def __len__(self):
+        '''
+        Number of nodes in the trie
+        '''
+        return len(self.counts)
+
+    def last_node(self, prefix):
+        '''
+        Returns the node for the last letter in the prefix,
+        if it exists
+
+        Inputs:
+            prefix (string): the prefix
+
+        Returns: (int) node if exists, None otherwise
+        '''
+        node = 0
+        for letter in prefix:
+            node = self.child(node, letter)
+            if node is None:
+                return None
+        return node
+
+    def child(self, node, letter):
+        '''
+        Returns the child of node on the edge labeled letter, or None
+        '''
+        index = self.labels.find(letter, self.first[node],
+                                 self.first[node + 1])
+        if index < 0:
+            return None
+        return index
+
+    def edges(self, node):
+        '''
+        Yields the (letter, child) pairs of a node
+        '''
+        for index in range(self.first[node], self.first[node + 1]):
+            yield self.labels[index], index
+
+    def is_final(self, node):
+        '''
+        Does a word end at node?
+        '''
+        return self.finals[node] == 1
+
+    def node_count(self, node):
+        '''
+        How many words go through node?
+        '''
+        return self.counts[node]
+
+    def node_weight(self, node):
+        '''
+        Frequency of the word that ends at node (see set_weights)
+        '''
+        return self.weights[node]
+
+    def node_best(self, node):
+        '''
+        Highest frequency of a word that goes through node
+        '''
+        return self.bests[node]
+
+    def set_weights(self, weights):
+        '''
+        Fills the weights array with the frequency of the word that ends
+        at every node, and the bests array with the highest weight below
+        every node
+
+        Inputs:
+          weights (dict): maps words to their frequency
+        '''
+        self.weights = array("q", bytes(8 * len(self)))
+        for word, weight in weights.items():
+            node = self.last_node(word)
+            if node is not None and self.is_final(node):
+                self.weights[node] = weight
+
+        # Children are numbered after their parent
+        self.bests = array("q", self.weights)
+        for node in range(len(self) - 1, -1, -1):
+            first, last = self.first[node], self.first[node + 1]
+            if first < last:
+                self.bests[node] = max(self.bests[node],
+                                       max(self.bests[first:last]))
+
+    def write(self, f, source_size=0, source_mtime=0):
+        '''
+        Writes the trie to a binary file that MappedTrie can map back
+
+        Inputs:
+          f (file): binary file open for writing
+          source_size (int): size of the word file the trie was built from
+          source_mtime (int): modification time of that file, in ns
+        '''
+        width = 1 if max(self.labels) <= "\xff" else 4
+        encoding = "latin-1" if width == 1 else "utf-32-le"
+
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(self), width,
+                                  source_size, source_mtime))
+        f.write(self.first.tobytes())
+        f.write(self.counts.tobytes())
+        f.write(self.finals)
+        f.write(self.labels.encode(encoding))
+
+
+class MappedTrie(ArrayTrie):
+    '''
+    ArrayTrie read in place from a buffer written by ArrayTrie.write,
+    usually a memory-mapped index file. Nothing is copied, so opening an
+    index takes the same time whatever its size, and processes that map
+    the same file share its pages.
+    '''
+
+    def __init__(self, buffer):
+        '''
+        Constructor
+
+        Inputs:
+          buffer (mmap or bytes): contents of an index file
+        '''
+        magic, nodes, width, self.source_size, self.source_mtime = \
+            INDEX_HEADER.unpack_from(buffer, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("not a dictionary index")
+
+        self.buffer = buffer
+        self.width = width
+        self.encoding = "latin-1" if width == 1 else "utf-32-le"
+
+        view = memoryview(buffer)
+        start = INDEX_HEADER.size
+        self.first = view[start:start + 4 * (nodes + 1)].cast("i")
+        start += 4 * (nodes + 1)
+        self.counts = view[start:start + 4 * nodes].cast("i")
+        start += 4 * nodes
+        self.finals = view[start:start + nodes]
+        self.labels_offset = start + nodes
+
+    def child(self, node, letter):
+        '''
+        Returns the child of node on the edge labeled letter, or None
+        '''
+        try:
+            code = letter.encode(self.encoding)
+        except UnicodeEncodeError:
+            return None
+
+        start = self.labels_offset + self.first[node] * self.width
+        end = self.labels_offset + self.first[node + 1] * self.width
+        index = self.buffer.find(code, start, end)
+        # Wide labels can match across two labels; skip those
+        while index >= 0 and (index - self.labels_offset) % self.width:
+            index = self.buffer.find(code, index + 1, end)
+
+        if index < 0:
+            return None
+        return (index - self.labels_offset) // self.width
+
+    def edges(self, node):
+        '''
+        Yields the (letter, child) pairs of a node
+        '''
+        first, last = self.first[node], self.first[node + 1]
+        labels = self.buffer[self.labels_offset + first * self.width:
+                             self.labels_offset + last * self.width]
+        return zip(labels.decode(self.encoding), range(first, last))
+
+    def write(self, f, source_size=None, source_mtime=None):
+        '''
+        Writes the index back to a binary file
+        '''
+        f.write(self.buffer)
+
+
+def source_stamp(wordfile):
+    '''
+    Returns the (size, modification time in ns) of a word file, which an
+    index records to tell whether it is stale
+    '''
+    stat = os.stat(wordfile)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_index(trie, indexfile, wordfile):
+    '''
+    Saves a trie built from wordfile to indexfile. The index is written
+    to a temporary file first, so that a shell starting at the same time
+    never maps a half-written index.
+    '''
+    size, mtime = source_stamp(wordfile)
+    temporary = "{}.{}.tmp".format(indexfile, os.getpid())
+    with open(temporary, "wb") as f:
+        trie.write(f, size, mtime)
+    os.replace(temporary, indexfile)
+
+
+def load_index(indexfile, wordfile):
+    '''
+    Memory-maps the index of wordfile
+
+    Returns: MappedTrie, or None if the index is missing, is not an index
+      or was built from another version of the word file
+    '''
+    try:
+        with open(indexfile, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        trie = MappedTrie(buffer)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if (trie.source_size, trie.source_mtime) != source_stamp(wordfile):
+        return None
+    return trie
+
+
+def index_trie(wordfile, words, indexfile=None):
+    '''
+    Returns the trie of wordfile from its index, building (and saving)
+    the index first if it is missing or stale
+
+    Inputs:
+      wordfile (string): name of the file with the words
+      words (function): returns the list of words of wordfile
+      indexfile (string): name of the index, by default wordfile + ".idx"
+
+    Returns: MappedTrie, or ArrayTrie if the index cannot be written
+    '''
+    if indexfile is None:
+        indexfile = wordfile + ".idx"
+
+    trie = load_index(indexfile, wordfile)
+    if trie is not None:
+        return trie
+
+    trie = ArrayTrie(words(wordfile))
+    try:
+        save_index(trie, indexfile, wordfile)
+    except OSError:
+        return trie
+    return load_index(indexfile, wordfile) or trie
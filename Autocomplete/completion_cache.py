@@ -0,0 +1,114 @@
+# CS122: Auto-completing keyboard using Tries
+# Least recently used cache of completions
+#
+
+from collections import OrderedDict
+
+
+class CompletionCache(object):
+    '''
+    Bounded cache of completion lists, keyed by (prefix, limit, ordered)
+    as passed to EnglishDictionary.get_completions. When it holds too
+    many entries, or too many characters of suffixes, the least recently
+    used entries are dropped.
+    '''
+
+    def __init__(self, max_entries, max_chars):
+        '''
+        Constructor
+
+        Inputs:
+          max_entries (int): the most completion lists to keep
+          max_chars (int): the most characters of suffixes to keep, which
+            bounds the memory the cache uses
+        '''
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        # key -> (tuple of suffixes, size in characters), oldest first
+        self.entries = OrderedDict()
+        # prefix -> keys of the entries for that prefix
+        self.keys_of = {}
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        '''
+        Number of completion lists in the cache
+        '''
+        return len(self.entries)
+
+    def get(self, key):
+        '''
+        Returns the completions cached for key, or None
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, completions):
+        '''
+        Caches the completions of key, unless they alone are over the
+        limits, then drops the least recently used entries until the
+        cache is within its limits again
+
+        Inputs:
+          key (tuple): (prefix, limit, ordered)
+          completions (tuple of strings): the suffixes
+        '''
+        size = len(completions) + sum(map(len, completions))
+        if self.max_entries < 1 or size > self.max_chars:
+            return
+
+        self.remove(key)
+        self.entries[key] = (completions, size)
+        self.keys_of.setdefault(key[0], set()).add(key)
+        self.chars += size
+
+        while len(self.entries) > self.max_entries or \
+                self.chars > self.max_chars:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        '''
+        Drops the entry of key, if there is one
+        '''
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        self.chars -= entry[1]
+        keys = self.keys_of[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.keys_of[key[0]]
+
+    def invalidate(self, word):
+        '''
+        Drops the entries that a new word changes: those of every prefix
+        of the word, including the word itself and the empty prefix
+        '''
+        for i in range(len(word) + 1):
+            for key in list(self.keys_of.get(word[:i], ())):
+                self.remove(key)
+
+    def clear(self):
+        '''
+        Drops every entry, but keeps the counters
+        '''
+        self.entries.clear()
+        self.keys_of.clear()
+        self.chars = 0
+
+    def stats(self):
+        '''
+        Returns a dict with the hits, misses, entries and characters of
+        the cache
+        '''
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self.entries), "chars": self.chars}
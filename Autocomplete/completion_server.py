@@ -0,0 +1,209 @@
+# CS122: Auto-completing keyboard using Tries
+# Completion server for many clients
+#
+# Serves one EnglishDictionary over TCP or a Unix socket with a line
+# protocol. Every request is one line, a command and its arguments
+# separated by spaces:
+#
+#   is_word WORD                    -> OK 1 (or OK 0)
+#   num_completions [PREFIX]        -> OK COUNT
+#   get_completions [PREFIX [LIMIT]]-> OK WORD WORD ...
+#   top_completions PREFIX K        -> OK WORD WORD ...
+#   fuzzy_versions WORD [DISTANCE]  -> OK WORD WORD ...
+#
+# and gets one line back, "OK" followed by the result or "ERR" followed
+# by what went wrong. Every request runs on the event loop, so the
+# expensive ones are bounded: get_completions sends DEFAULT_LIMIT words
+# unless asked for more, LIMIT and K are at most MAX_LIMIT, DISTANCE is
+# at most MAX_DISTANCE and the WORD of fuzzy_versions is at most
+# MAX_FUZZY_WORD characters long. Completions are sent as whole words, in
+# alphabetical order (by frequency for top_completions), and fuzzy
+# versions closest first, with nearby keys as in the shell. A client may
+# send several requests before reading the answers, which come back in
+# order.
+
+import sys
+import asyncio
+
+import autocorrect_shell
+import english_dictionary
+
+PORT = 8122
+# The longest request line accepted
+MAX_LINE = 1 << 16
+# Number of completions sent when the request gives no limit, and the
+# largest limit a request may ask for
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# The largest edit distance and longest word of fuzzy_versions
+MAX_DISTANCE = 2
+MAX_FUZZY_WORD = 64
+
+
+def parse_limit(text):
+    '''
+    Parse a limit on the number of words of a response
+
+    Inputs:
+      text (string): the argument
+
+    Returns: int, between 0 and MAX_LIMIT
+    '''
+    value = int(text)
+    if not 0 <= value <= MAX_LIMIT:
+        raise ValueError("limit must be between 0 and {}: {}"
+                         .format(MAX_LIMIT, text))
+    return value
+
+
+def parse_distance(text):
+    '''
+    Parse the edit distance of fuzzy_versions
+
+    Inputs:
+      text (string): the argument
+
+    Returns: float, between 0 and MAX_DISTANCE
+    '''
+    value = float(text)
+    # Also rejects nan, which fails every comparison
+    if not 0 <= value <= MAX_DISTANCE:
+        raise ValueError("distance must be between 0 and {}: {}"
+                         .format(MAX_DISTANCE, text))
+    return value
+
+
+def answer(eng_dict, line):
+    '''
+    Answer one request line
+
+    Inputs:
+      eng_dict (EnglishDictionary): the dictionary
+      line (string): the request, without its end of line
+
+    Returns: string, the response without its end of line
+    '''
+    fields = line.split()
+    if not fields:
+        return "ERR empty request"
+    command, args = fields[0], fields[1:]
+
+    try:
+        if command == "is_word" and len(args) == 1:
+            return "OK " + str(int(eng_dict.is_word(args[0])))
+
+        if command == "num_completions" and len(args) <= 1:
+            prefix = args[0] if args else ""
+            return "OK " + str(eng_dict.num_completions(prefix))
+
+        if command == "get_completions" and len(args) <= 2:
+            prefix = args[0] if args else ""
+            limit = parse_limit(args[1]) if len(args) == 2 else DEFAULT_LIMIT
+            words = [prefix + suffix for suffix in
+                     eng_dict.get_completions(prefix, limit, ordered=True)]
+
+        elif command == "top_completions" and len(args) == 2:
+            words = [args[0] + suffix for suffix in
+                     eng_dict.top_completions(args[0], parse_limit(args[1]))]
+
+        elif command == "fuzzy_versions" and len(args) in (1, 2):
+            if len(args[0]) > MAX_FUZZY_WORD:
+                raise ValueError("word must be at most {} characters long"
+                                 .format(MAX_FUZZY_WORD))
+            distance = english_dictionary.FUZZY_DISTANCE
+            if len(args) == 2:
+                distance = parse_distance(args[1])
+            words = eng_dict.fuzzy_versions(
+                args[0], distance, autocorrect_shell.nearby_keys)
+
+        else:
+            return "ERR bad request: " + line
+
+    except ValueError as e:
+        return "ERR " + str(e)
+
+    return " ".join(["OK"] + words)
+
+
+async def handle_client(eng_dict, reader, writer):
+    '''
+    Answer the requests of one client until it closes the connection.
+    The dictionary is only used from the event loop, so clients share it
+    without locks.
+    '''
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # The line was over MAX_LINE bytes
+                writer.write(b"ERR request too long\n")
+                break
+            if not line:
+                break
+
+            response = answer(eng_dict,
+                              line.decode("utf-8", "replace").strip())
+            writer.write(response.encode("utf-8") + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(eng_dict, port=PORT, path=None, host="127.0.0.1"):
+    '''
+    Start serving a dictionary
+
+    Inputs:
+      eng_dict (EnglishDictionary): the dictionary
+      port (int): TCP port to listen on (0 for any free port)
+      path (string): Unix socket to listen on instead, if given
+      host (string): address to listen on
+
+    Returns: asyncio.Server, already accepting connections
+    '''
+    def handler(reader, writer):
+        return handle_client(eng_dict, reader, writer)
+
+    if path is not None:
+        return await asyncio.start_unix_server(handler, path,
+                                               limit=MAX_LINE)
+    return await asyncio.start_server(handler, host, port, limit=MAX_LINE)
+
+
+async def run(eng_dict, port, path):
+    '''
+    Serve a dictionary until the process is interrupted
+    '''
+    server = await serve(eng_dict, port, path)
+    print("Serving on " + (path or "port " + str(port)))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    options = {"--port": str(PORT), "--unix": None, "--backend": "mapped"}
+    args = []
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg in options:
+            options[arg] = next(argv, "")
+        else:
+            args.append(arg)
+
+    if len(args) not in (1, 2) or not options["--port"].isdigit():
+        print("Usage: python3 completion_server.py WORD_FILE "
+              "[FREQUENCY_FILE] [--port PORT | --unix PATH] "
+              "[--backend BACKEND]")
+        sys.exit(1)
+
+    frequencyfile = args[1] if len(args) == 2 else None
+    eng_dict = english_dictionary.EnglishDictionary(
+        args[0], options["--backend"], frequencyfile=frequencyfile)
+
+    try:
+        asyncio.run(run(eng_dict, int(options["--port"]), options["--unix"]))
+    except KeyboardInterrupt:
+        print()
@@ -0,0 +1,163 @@
+# CS122: Auto-completing keyboard using Tries
+# Minimal DAWG (directed acyclic word graph)
+#
+
+from array import array
+
+from compact_trie import ArrayTrie
+
+
+class Dawg(ArrayTrie):
+    '''
+    Minimal acyclic automaton accepting the same words as a trie. Nodes
+    of the trie that end the same set of suffixes ("-ing", "-tion", ...)
+    are merged into one, so it has several times fewer nodes than the
+    trie on a large vocabulary.
+
+    A node no longer has a single parent, so on top of the ArrayTrie
+    arrays every edge stores the node it leads to:
+
+      first[i]    edges of node i are first[i] .. first[i + 1] - 1
+      labels[e]   letter of edge e
+      targets[e]  node edge e leads to
+      counts[i]   number of words below node i, which only depends on
+                  the suffixes below it and is therefore the same for
+                  every path that reaches it
+      finals[i]   1 if a word ends at node i
+    '''
+
+    def __init__(self, words):
+        '''
+        Constructor. The automaton is built incrementally from the sorted
+        words: once a word is added, the nodes of the previous word past
+        their common prefix will never change again, so they are merged
+        with an equivalent node already seen, if there is one.
+
+        Inputs:
+          words (list of strings): the words, in any order and possibly
+            with duplicates
+        '''
+        self.edge_lists = [{}]
+        self.final_list = [False]
+        self.count_list = [0]
+        self.free = []
+        # (final, edges) of every node that is known to be minimal
+        self.register = {}
+        # (parent, letter, child) along the last word, not yet minimized
+        self.unchecked = []
+
+        previous = ""
+        for word in sorted(set(words)):
+            common = 0
+            while (common < len(word) and common < len(previous) and
+                   word[common] == previous[common]):
+                common += 1
+            self.minimize(common)
+
+            node = self.unchecked[-1][2] if self.unchecked else 0
+            for letter in word[common:]:
+                child = self.new_node()
+                self.edge_lists[node][letter] = child
+                self.unchecked.append((node, letter, child))
+                node = child
+            self.final_list[node] = True
+            previous = word
+
+        self.minimize(0)
+        self.count_list[0] = self.final_list[0] + sum(
+            self.count_list[child] for child in self.edge_lists[0].values())
+        self.freeze()
+
+    def new_node(self):
+        '''
+        Returns a new node, reusing one that was merged away if possible
+        '''
+        if self.free:
+            node = self.free.pop()
+            self.edge_lists[node] = {}
+            self.final_list[node] = False
+            return node
+
+        self.edge_lists.append({})
+        self.final_list.append(False)
+        self.count_list.append(0)
+        return len(self.edge_lists) - 1
+
+    def minimize(self, depth):
+        '''
+        Replaces the unchecked nodes deeper than depth by an equivalent
+        registered node, or registers them
+        '''
+        while len(self.unchecked) > depth:
+            parent, letter, child = self.unchecked.pop()
+            edges = self.edge_lists[child]
+            key = (self.final_list[child], tuple(sorted(edges.items())))
+
+            if key in self.register:
+                self.edge_lists[parent][letter] = self.register[key]
+                self.edge_lists[child] = None
+                self.free.append(child)
+            else:
+                self.register[key] = child
+                self.count_list[child] = self.final_list[child] + sum(
+                    self.count_list[node] for node in edges.values())
+
+    def freeze(self):
+        '''
+        Moves the automaton into flat arrays, numbering the nodes in
+        breadth-first order from the root, and drops the build state
+        '''
+        number = {0: 0}
+        order = [0]
+        labels = []
+        self.targets = array("i")
+        self.first = array("i")
+        self.counts = array("i")
+        self.finals = bytearray()
+
+        for node in order:
+            self.first.append(len(labels))
+            self.counts.append(self.count_list[node])
+            self.finals.append(self.final_list[node])
+            for letter, child in sorted(self.edge_lists[node].items()):
+                if child not in number:
+                    number[child] = len(order)
+                    order.append(child)
+                labels.append(letter)
+                self.targets.append(number[child])
+
+        self.first.append(len(labels))
+        self.labels = "".join(labels)
+
+        del self.edge_lists, self.final_list, self.count_list
+        del self.free, self.register, self.unchecked
+
+    def child(self, node, letter):
+        '''
+        Returns the child of node on the edge labeled letter, or None
+        '''
+        index = self.labels.find(letter, self.first[node],
+                                 self.first[node + 1])
+        if index < 0:
+            return None
+        return self.targets[index]
+
+    def edges(self, node):
+        '''
+        Yields the (letter, child) pairs of a node
+        '''
+        for index in range(self.first[node], self.first[node + 1]):
+            yield self.labels[index], self.targets[index]
+
+    def set_weights(self, weights):
+        '''
+        A node of a DAWG is shared by words with different prefixes, so it
+        cannot hold the frequency of one of them
+        '''
+        raise TypeError("a DAWG cannot rank words by frequency")
+
+    def write(self, f, source_size=0, source_mtime=0):
+        '''
+        A DAWG has no index format
+        '''
+        raise TypeError("a DAWG cannot be saved as a dictionary index")
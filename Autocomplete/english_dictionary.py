@@ -9,28 +9,153 @@
 #
 # Rhedintza Audryna
 
+import gc
+import math
 import os
 import sys
 from sys import exit
+import heapq
+from itertools import islice
 
 import autocorrect_shell
+import compact_trie
+import completion_cache
+import dawg
+
+BACKENDS = ["node", "array", "mapped", "dawg"]
+FUZZY_DISTANCE = 1
+# Cost of typing a key next to the right one, instead of another letter
+NEARBY_COST = 0.5
+CACHE_ENTRIES = 1024
+CACHE_CHARS = 1 << 20
+
+
+def read_words(wordfile):
+    '''
+    The non-empty words of a word file, one per line
+
+    Inputs:
+      wordfile (string): name of the file with the words.
+
+    Returns: list of strings
+    '''
+    with open(wordfile) as f:
+        return [w for w in (line.strip() for line in f) if w != ""]
+
+
+def read_frequencies(frequencyfile):
+    '''
+    The frequencies of a frequency file, with one word and its count
+    separated by white space on each line
+
+    Inputs:
+      frequencyfile (string): name of the file with the frequencies.
+
+    Returns: dict mapping words to ints
+    '''
+    frequencies = {}
+    with open(frequencyfile) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2:
+                frequencies[fields[0]] = int(fields[1])
+    return frequencies
 
 
 class EnglishDictionary(object):
-    def __init__(self, wordfile):
+    def __init__(self, wordfile, backend="node", indexfile=None,
+                 frequencyfile=None, cache_entries=CACHE_ENTRIES,
+                 cache_chars=CACHE_CHARS):
         '''
         Constructor
 
         Inputs:
           wordfile (string): name of the file with the words.
+          backend (string): how the trie is stored, one of BACKENDS:
+            "node" for a TrieNode per letter, "array" for an ArrayTrie,
+            "mapped" for an ArrayTrie memory-mapped from a prebuilt index
+            (rebuilt from the word file when it is missing or stale),
+            "dawg" for a minimal Dawg that shares common suffixes
+          indexfile (string): name of the index of the "mapped" backend,
+            by default wordfile + ".idx"
+          frequencyfile (string): name of a file with word frequencies
+            (see read_frequencies) used to rank completions, if any
+          cache_entries (int): the most results of get_completions to
+            keep in a CompletionCache, 0 for no cache
+          cache_chars (int): the most characters of suffixes to keep in
+            the cache
+        '''
+        if backend not in BACKENDS:
+            raise ValueError("unknown dictionary backend: " + str(backend))
+
+        if backend == "array":
+            self.words = compact_trie.ArrayTrie(read_words(wordfile))
+
+        elif backend == "dawg":
+            self.words = dawg.Dawg(read_words(wordfile))
+
+        elif backend == "mapped":
+            self.words = compact_trie.index_trie(wordfile, read_words,
+                                                 indexfile)
+
+        else:
+            self.words = TrieNode.from_sorted(sorted(read_words(wordfile)))
+
+        self.ranked = False
+        if frequencyfile is not None:
+            self.set_frequencies(read_frequencies(frequencyfile))
+
+        self.cache = None
+        if cache_entries > 0:
+            self.cache = completion_cache.CompletionCache(cache_entries,
+                                                          cache_chars)
+
+    def add_word(self, w, frequency=0):
+        '''
+        Add a word to the dictionary, which must use the node backend
+        (the others are built once and cannot change)
+
+        Inputs:
+          w (string): the word to add
+          frequency (int): its frequency, if completions are ranked
+
+        Returns: boolean, False if w already was a word
+        '''
+
+        if not isinstance(self.words, TrieNode):
+            raise TypeError("only the node backend can add words")
+        if w == "" or self.is_word(w):
+            return False
+
+        self.words.add_word(w)
+
+        if self.ranked:
+            # The nodes just created have no weight yet
+            nodes = [self.words]
+            for letter in w:
+                nodes.append(nodes[-1].children[letter])
+            for node in nodes:
+                if not hasattr(node, "weight"):
+                    node.weight = node.best = 0
+                node.best = max(node.best, frequency)
+            nodes[-1].weight = frequency
+
+        if self.cache is not None:
+            self.cache.invalidate(w)
+        return True
+
+    def set_frequencies(self, frequencies):
         '''
-        self.words = TrieNode()
+        Rank the completions of top_completions by word frequency. Every
+        node is annotated with the highest frequency of a word below it,
+        so the best words can be found without visiting the others.
 
-        with open(wordfile) as f:
-            for w in f:
-                w = w.strip()
-                if w != "" and not self.is_word(w):
-                    self.words.add_word(w)
+        Inputs:
+          frequencies (dict): maps words to their frequency; words that
+            are missing have frequency 0
+        '''
+        self.words.set_weights(frequencies)
+        self.ranked = True
 
     def is_word(self, w):
         '''
@@ -42,8 +167,9 @@ class EnglishDictionary(object):
         Returns: boolean
         '''
 
-        if self.words.last_node(w):
-            return self.words.last_node(w).final
+        node = self.words.last_node(w)
+        if node is not None:
+            return self.words.is_final(node)
         else:
             return False
 
@@ -58,32 +184,314 @@ class EnglishDictionary(object):
         Returns: int
         '''
 
-        if self.words.last_node(prefix):
-            return self.words.last_node(prefix).count
+        node = self.words.last_node(prefix)
+        if node is not None:
+            return self.words.node_count(node)
         else:
             return 0
 
-    def get_completions(self, prefix):
+    def get_completions(self, prefix, limit=None, ordered=False):
         '''
         Get the suffixes in the dictionary of words that start with the
         specified prefix.
 
         Inputs:
           prefix (string): the prefix
+          limit (int): return at most this many suffixes, if given
+          ordered (boolean): return the suffixes in alphabetical order
 
         Returns: list of strings.
         '''
 
+        if self.cache is None:
+            return list(self.iter_completions(prefix, limit, ordered))
+
+        key = (prefix, limit, ordered)
+        completions = self.cache.get(key)
+        if completions is None:
+            completions = tuple(self.iter_completions(prefix, limit, ordered))
+            self.cache.put(key, completions)
+        return list(completions)
+
+    def iter_completions(self, prefix, limit=None, ordered=False):
+        '''
+        Generate the suffixes of the words that start with the specified
+        prefix, one at a time, so that callers who only want the first
+        few do not pay for the rest. The trie is walked depth first with
+        an explicit stack, so long words cannot hit the recursion limit.
+
+        Inputs:
+          prefix (string): the prefix
+          limit (int): stop after this many suffixes, if given
+          ordered (boolean): generate the suffixes in alphabetical order
+
+        Returns: generator of strings
+        '''
+
         last_node = self.words.last_node(prefix)
 
-        if last_node:
-            if last_node.final:
-                return [''] + last_node.trie_to_words('')
-            else:
-                return [] + last_node.trie_to_words('')
+        if last_node is None:
+            return iter([])
+        return islice(self.walk(last_node, ordered), limit)
+
+    def top_completions(self, prefix, k):
+        '''
+        Get the suffixes of the k most frequent words that start with the
+        specified prefix, most frequent first (alphabetically among
+        words of the same frequency). Without frequencies, these are the
+        first k suffixes in alphabetical order.
+
+        Nodes are visited best first from a heap ordered by the highest
+        frequency below them, so only the branches that hold one of the
+        k words, and their siblings, are looked at.
+
+        Inputs:
+          prefix (string): the prefix
+          k (int): the number of suffixes
+
+        Returns: list of strings.
+        '''
+
+        if not self.ranked:
+            return self.get_completions(prefix, k, ordered=True)
+
+        trie = self.words
+        last_node = trie.last_node(prefix)
+        if last_node is None:
+            return []
+
+        # Entries are (-frequency, suffix, is a node, node): a word comes
+        # out before the node it ends at, and no two nodes have the same
+        # suffix, so nodes themselves are never compared
+        heap = [(-trie.node_best(last_node), '', True, last_node)]
+        completions = []
+
+        while heap and len(completions) < k:
+            _, suffix, is_node, node = heapq.heappop(heap)
+            if not is_node:
+                completions.append(suffix)
+                continue
+
+            if trie.is_final(node):
+                heapq.heappush(heap, (-trie.node_weight(node), suffix,
+                                      False, None))
+            for letter, child in trie.edges(node):
+                heapq.heappush(heap, (-trie.node_best(child),
+                                      suffix + letter, True, child))
+
+        return completions
+
+    def fuzzy_versions(self, word, distance=FUZZY_DISTANCE, nearby=None):
+        '''
+        Get the words of the dictionary within an edit distance of the
+        specified word. The trie is walked with one row of the
+        Levenshtein table per node, computed from the row of its parent,
+        and a branch is dropped as soon as every entry of its row is over
+        the distance, since going deeper can only make them larger.
+
+        Inputs:
+          word (string): the (misspelled) word
+          distance (number): the largest edit distance allowed
+          nearby (function): returns the list of keys near a letter, if
+            given; substituting one of them costs NEARBY_COST instead of 1
+
+        Returns: list of strings, the closest words first
+        '''
+
+        trie = self.words
+        if nearby is None:
+            near = [()] * len(word)
         else:
+            near = [set(nearby(letter)) for letter in word]
+        if not distance >= 0:
             return []
 
+        # Every letter of difference in length takes an insertion or a
+        # deletion of cost 1, so only the entries of a row at most "band"
+        # columns away from the diagonal can be within the distance. Each
+        # row holds those entries, from column "start" on.
+        band = int(min(distance, sys.maxsize))
+        found = []
+        stack = [(trie.last_node(''), '', 0,
+                  list(range(min(len(word), band) + 1)))]
+
+        while stack:
+            node, prefix, row_start, row = stack.pop()
+            depth = len(prefix) + 1
+            start = max(0, depth - band)
+            end = min(len(word), depth + band)
+            if start > end:
+                continue
+            row_end = row_start + len(row)
+
+            for letter, child in trie.edges(node):
+                new_row = []
+                left = math.inf
+                for j in range(start, end + 1):
+                    # Smallest of a substitution (or match), an insertion
+                    # and a deletion
+                    if j == 0:
+                        left = depth
+                    else:
+                        left += 1
+                        if row_start < j <= row_end:
+                            diagonal = row[j - 1 - row_start]
+                            if word[j - 1] != letter:
+                                diagonal += (NEARBY_COST
+                                             if letter in near[j - 1] else 1)
+                            if diagonal < left:
+                                left = diagonal
+                    if j < row_end and row[j - row_start] + 1 < left:
+                        left = row[j - row_start] + 1
+                    new_row.append(left)
+
+                if (end == len(word) and new_row[-1] <= distance
+                        and trie.is_final(child)):
+                    found.append((new_row[-1], prefix + letter))
+                if min(new_row) <= distance:
+                    stack.append((child, prefix + letter, start, new_row))
+
+        found.sort()
+        return [w for _, w in found]
+
+    def cursor(self, prefix=''):
+        '''
+        Get a PrefixCursor positioned after the specified prefix
+
+        Inputs:
+          prefix (string): the prefix
+
+        Returns: PrefixCursor
+        '''
+
+        cursor = PrefixCursor(self)
+        for letter in prefix:
+            cursor.advance(letter)
+        return cursor
+
+    def walk(self, node, ordered):
+        '''
+        Generate the suffixes of the words below node, the shorter words
+        of a branch before the longer ones
+
+        Inputs:
+          node: node of self.words
+          ordered (boolean): follow the edges in alphabetical order
+
+        Returns: generator of strings
+        '''
+
+        trie = self.words
+        stack = [(node, '')]
+
+        while stack:
+            node, suffix = stack.pop()
+            if trie.is_final(node):
+                yield suffix
+
+            # The last edge pushed is the first one followed
+            edges = trie.edges(node)
+            if ordered:
+                edges = sorted(edges, key=lambda edge: edge[0], reverse=True)
+            for letter, child in edges:
+                stack.append((child, suffix + letter))
+
+
+class PrefixCursor(object):
+    '''
+    Position in the trie of a word being typed one letter at a time.
+    The cursor keeps the node of every prefix of the word, so adding or
+    removing a letter takes one step whatever the length of the word,
+    instead of walking the trie again from the root.
+    '''
+
+    def __init__(self, eng_dict):
+        '''
+        Constructor for a cursor at the empty prefix
+
+        Inputs:
+          eng_dict (EnglishDictionary): the dictionary
+        '''
+
+        self.eng_dict = eng_dict
+        self.trie = eng_dict.words
+        self.letters = []
+        # nodes[i] is the node of the first i letters, None off the trie
+        self.nodes = [self.trie.last_node('')]
+
+    @property
+    def word(self):
+        '''
+        The prefix the cursor is at
+        '''
+        return ''.join(self.letters)
+
+    def advance(self, letter):
+        '''
+        Add a letter to the prefix
+
+        Inputs:
+          letter (string): the letter typed
+        '''
+
+        node = self.nodes[-1]
+        if node is not None:
+            node = self.trie.child(node, letter)
+        self.letters.append(letter)
+        self.nodes.append(node)
+
+    def back(self):
+        '''
+        Remove the last letter of the prefix, if there is one
+        '''
+
+        if self.letters:
+            self.letters.pop()
+            self.nodes.pop()
+
+    def reset(self):
+        '''
+        Go back to the empty prefix
+        '''
+
+        del self.letters[:]
+        del self.nodes[1:]
+
+    def is_word(self):
+        '''
+        Is the prefix a word?
+
+        Returns: boolean
+        '''
+
+        node = self.nodes[-1]
+        return node is not None and self.trie.is_final(node)
+
+    def num_completions(self):
+        '''
+        How many words in the dictionary start with the prefix?
+
+        Returns: int
+        '''
+
+        node = self.nodes[-1]
+        if node is None:
+            return 0
+        return self.trie.node_count(node)
+
+    def iter_completions(self, limit=None, ordered=False):
+        '''
+        Generate the suffixes of the words that start with the prefix
+        (see EnglishDictionary.iter_completions)
+
+        Returns: generator of strings
+        '''
+
+        node = self.nodes[-1]
+        if node is None:
+            return iter([])
+        return islice(self.eng_dict.walk(node, ordered), limit)
+
 
 class TrieNode(object):
     def __init__(self):
@@ -95,6 +503,69 @@ class TrieNode(object):
         self.final = False
         self.children = {}
 
+    @classmethod
+    def from_sorted(cls, words):
+        '''
+        Builds a trie in a single pass over sorted words. A word only
+        differs from the one before it after their longest common prefix,
+        so the nodes of that prefix are reused and nodes are only created
+        for the rest of the word. The nodes past the common prefix are
+        then complete, so each of them adds its count to its parent's as
+        it is left.
+
+        The garbage collector is paused meanwhile: the trie has no cycles
+        to collect, and scanning its growing number of nodes over and over
+        would take most of the time.
+
+        Inputs:
+            words (iterable of strings): the words in sorted order, which
+              may be repeated
+
+        Returns: (object) the root TrieNode
+        '''
+
+        root = cls()
+        # Nodes of the previous word, path[i] after its first i letters
+        path = [root]
+        previous = ''
+
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for word in words:
+                if word < previous:
+                    raise ValueError("words are not sorted: {!r} comes "
+                                     "after {!r}".format(word, previous))
+                if word == previous:
+                    continue
+
+                common = 0
+                limit = min(len(word), len(previous))
+                while common < limit and word[common] == previous[common]:
+                    common += 1
+
+                while len(path) > common + 1:
+                    node = path.pop()
+                    path[-1].count += node.count
+
+                node = path[-1]
+                for i in range(common, len(word)):
+                    child = cls()
+                    node.children[word[i]] = child
+                    path.append(child)
+                    node = child
+                node.final = True
+                node.count = 1
+                previous = word
+
+            while len(path) > 1:
+                node = path.pop()
+                path[-1].count += node.count
+        finally:
+            if collecting:
+                gc.enable()
+        return root
+
     def add_word(self, word):
         '''
         Adds a word to the trie
@@ -122,14 +593,81 @@ class TrieNode(object):
         Returns: (object) TrieNode if exists, None otherwise
         '''
 
-        if not prefix:
-            return self
-
-        else:
-            if prefix[0] in self.children:
-                return self.children[prefix[0]].last_node(prefix[1:])
-            else:
+        node = self
+        for letter in prefix:
+            node = node.children.get(letter)
+            if node is None:
                 return None
+        return node
+
+    # The methods below take the node they work on, so that the
+    # dictionary can use a TrieNode (through its root) and an ArrayTrie
+    # (whose nodes are integers) in the same way.
+
+    @staticmethod
+    def child(node, letter):
+        '''
+        Returns the child of node on the edge labeled letter, or None
+        '''
+        return node.children.get(letter)
+
+    @staticmethod
+    def edges(node):
+        '''
+        Returns the (letter, child) pairs of a node
+        '''
+        return node.children.items()
+
+    @staticmethod
+    def is_final(node):
+        '''
+        Does a word end at node?
+        '''
+        return node.final
+
+    @staticmethod
+    def node_count(node):
+        '''
+        How many words go through node?
+        '''
+        return node.count
+
+    @staticmethod
+    def node_weight(node):
+        '''
+        Frequency of the word that ends at node (see set_weights)
+        '''
+        return node.weight
+
+    @staticmethod
+    def node_best(node):
+        '''
+        Highest frequency of a word that goes through node
+        '''
+        return node.best
+
+    def set_weights(self, weights):
+        '''
+        Sets the weight of every node to the frequency of the word that
+        ends there, and its best to the highest weight below it
+
+        Inputs:
+            weights (dict): maps words to their frequency
+        '''
+
+        nodes = []
+        stack = [(self, '')]
+        while stack:
+            node, word = stack.pop()
+            node.weight = weights.get(word, 0) if node.final else 0
+            nodes.append(node)
+            for letter, child in node.children.items():
+                stack.append((child, word + letter))
+
+        # Children come after their parent in nodes
+        for node in reversed(nodes):
+            node.best = max([node.weight] +
+                            [child.best for child in node.children.values()])
 
     def trie_to_words(self, prev):
         '''
@@ -152,4 +690,4 @@ class TrieNode(object):
 
 
 if __name__ == "__main__":
-    autocorrect_shell.go("english_dictionary")
+    autocorrect_shell.go("english_dictionary", "mapped")
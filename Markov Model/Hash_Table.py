@@ -1,14 +1,71 @@
 # CS122 W'21: Markov models and hash tables
 # Rhedintza Audryna
 
+import math
+import struct
+import threading
+from array import array
 
 TOO_FULL = 0.5
 GROWTH_RATIO = 2
 
+HASH_BASE = 37
+HASH_MODULUS = (1 << 61) - 1
+EMPTY = -1
+MOVED = -2
+MIGRATE_STEP = 8
+PROBING = ["linear", "quadratic", "double", "robin_hood"]
+# scrambles the bits of a hash when a second, independent hash is needed
+HASH_MIX = 0x9E3779B97F4A7C15
+SHARDS = 16
+# cells, counter, number of key bytes and probing of a table written to disk
+TABLE_HEADER = struct.Struct("=qqqq")
+
+
+class Table_Full_Error(RuntimeError):
+    '''
+    Raised when a probe sequence visits every slot of a table without
+    finding the key or an empty slot
+    '''
+
+
+def check_growth(too_full, growth_ratio):
+    '''
+    Raises ValueError unless a table with these settings always keeps an
+    empty slot and gets larger when it grows
+
+    Inputs:
+        too_full (float): the load factor above which the table grows
+        growth_ratio (int): how many times larger the table gets
+    '''
+    if not 0 < too_full < 1:
+        raise ValueError("too_full must be between 0 and 1")
+    if not growth_ratio > 1:
+        raise ValueError("growth_ratio must be greater than 1")
+
+
+def hash_string(s):
+    '''
+    Takes in a string and returns a hash value that does not depend on
+    the size of the table, so it can be stored and reused after a resize
+
+    Inputs:
+        s (str): the string
+
+    Returns:
+        (int) hash value in the range [0, HASH_MODULUS)
+    '''
+    hash = 0
+    for char in s:
+        hash = (hash * HASH_BASE + ord(char)) % HASH_MODULUS
+
+    return hash
+
 
 class Hash_Table:
 
-    def __init__(self, cells, defval):
+    def __init__(self, cells, defval, too_full=TOO_FULL,
+                 growth_ratio=GROWTH_RATIO):
         '''
         Construct a new hash table with a fixed number of cells equal to the
         parameter "cells", and which yields the value defval upon a lookup to a
@@ -17,10 +74,16 @@ class Hash_Table:
         Inputs:
             cells (int): the initial length of the hash table
             defval (str): the value that needs to be returned when key is not found
+            too_full (float): the load factor above which the table grows
+            growth_ratio (int): how many times larger the table gets
         '''
+        check_growth(too_full, growth_ratio)
         self.table = [None] * cells
         self.defval = defval
         self.counter = 0
+        self.too_full = too_full
+        self.growth_ratio = growth_ratio
+        self.resizes = 0
 
     def hashing(self, s):
         '''
@@ -74,8 +137,9 @@ class Hash_Table:
 
         if not self.table[index]:
             self.counter += 1
-            if self.counter / len(self.table) > TOO_FULL:
+            if self.counter / len(self.table) > self.too_full:
                 self.rehashing()
+                index = self.find_index(key)
 
         self.table[index] = (key, val)
 
@@ -114,10 +178,1191 @@ class Hash_Table:
         Returns:
             None, modifies hash table in place
         '''
-        stored_pairs = self.table[:]
-        self.table = [None] * (GROWTH_RATIO * len(stored_pairs))
-        self.counter = 1
+        self.resize(self.growth_ratio * len(self.table))
+        # The pair that triggered the rehash is already counted by update
+        self.counter += 1
+
+    def resize(self, cells):
+        '''
+        Replaces the hash table by one with the given number of cells and
+        reinserts all of its current values
+
+        Inputs:
+            cells (int): the new length of the hash table
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        stored_pairs = self.table
+        self.table = [None] * cells
+        self.counter = 0
+        self.resizes += 1
 
         for pairs in stored_pairs:
             if pairs:
                 self.update(pairs[0], pairs[1])
+
+    def size(self):
+        '''
+        Returns the number of cells of the hash table
+        '''
+        return len(self.table)
+
+    def __len__(self):
+        '''
+        Returns the number of keys stored in the hash table
+        '''
+        return self.counter
+
+    def items(self):
+        '''
+        Yields every (key, value) pair stored in the hash table
+        '''
+        for pairs in self.table:
+            if pairs:
+                yield pairs
+
+    def increment(self, key, delta=1):
+        '''
+        Adds "delta" to the value associated with key "key", treating a
+        missing key as having the default value. Existing keys are updated
+        with a single probe.
+
+        Inputs:
+            key (str): the key
+            delta (int): the amount to add
+
+        Returns:
+            None, updates hash table in place
+        '''
+        index = self.find_index(key)
+
+        if self.table[index]:
+            self.table[index] = (key, self.table[index][1] + delta)
+        else:
+            self.update(key, self.defval + delta)
+
+    def merge(self, other):
+        '''
+        Adds the values of another hash table to the values of this one, key
+        by key, for example to combine counts made on different texts
+
+        Inputs:
+            other (Hash_Table): any hash table
+
+        Returns:
+            None, updates hash table in place
+        '''
+        for key, val in other.items():
+            self.increment(key, val)
+
+    def update_many(self, pairs, size_hint=None):
+        '''
+        Updates the hash table with every (key, value) pair of an iterable,
+        growing the table once up front when the number of pairs is known
+
+        Inputs:
+            pairs (iterable): (key, value) tuples
+            size_hint (int): expected number of new keys, defaults to
+                the length of "pairs" when it has one
+
+        Returns:
+            None, updates hash table in place
+        '''
+        if size_hint is None and hasattr(pairs, "__len__"):
+            size_hint = len(pairs)
+        if size_hint:
+            self.reserve(self.counter + size_hint)
+
+        for key, val in pairs:
+            self.update(key, val)
+
+    def reserve(self, n):
+        '''
+        Grows the hash table so that it can hold "n" keys without having
+        to rehash
+
+        Inputs:
+            n (int): the number of keys
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        cells = self.size()
+        while n / cells > self.too_full:
+            cells *= self.growth_ratio
+
+        if cells != self.size():
+            self.resize(cells)
+
+    def probe_lengths(self):
+        '''
+        Yields, for every stored key, the number of slots that are probed
+        to find it
+        '''
+        cells = len(self.table)
+        for index, pairs in enumerate(self.table):
+            if pairs:
+                yield (index - self.hashing(pairs[0])) % cells + 1
+
+    def occupied(self):
+        '''
+        Returns a list telling, for every slot, whether it holds a key
+        '''
+        return [bool(pairs) for pairs in self.table]
+
+    def cluster_sizes(self):
+        '''
+        Returns the lengths of the runs of consecutive occupied slots,
+        a run at the end of the table continuing at its start
+        '''
+        occupied = self.occupied()
+        cells = len(occupied)
+        if all(occupied):
+            return [cells] if cells else []
+
+        sizes = []
+        run = 0
+        start = occupied.index(False)
+        for i in range(start, start + cells):
+            if occupied[i % cells]:
+                run += 1
+            elif run:
+                sizes.append(run)
+                run = 0
+        if run:
+            sizes.append(run)
+
+        return sizes
+
+    def probe_stats(self):
+        '''
+        Measures how well the keys are spread over the hash table
+
+        Returns:
+            dict with the number of keys and cells, the load factor, the
+            mean and max probe lengths, the number, mean and max size of
+            the clusters of occupied slots, and the number of resizes
+        '''
+        lengths = list(self.probe_lengths())
+        clusters = self.cluster_sizes()
+
+        return {"keys": len(self),
+                "cells": self.size(),
+                "load": len(self) / self.size(),
+                "mean_probe": sum(lengths) / len(lengths) if lengths else 0,
+                "max_probe": max(lengths, default=0),
+                "clusters": len(clusters),
+                "mean_cluster": (sum(clusters) / len(clusters)
+                                 if clusters else 0),
+                "max_cluster": max(clusters, default=0),
+                "resizes": self.resizes}
+
+
+class Compact_Hash_Table(Hash_Table):
+    '''
+    Open-addressing hash table that keeps the hashes, keys and values in
+    three parallel arrays instead of one (key, value) tuple per slot.
+    The stored hashes let probes skip the string comparison whenever
+    the hashes differ, and let rehashing move entries without hashing
+    the keys again.
+
+    The probing scheme is one of PROBING:
+        linear: try the next slot
+        quadratic: try slots 1, 2, 3, ... further than the previous one
+        double: step by a second hash, the hash scrambled by a multiplication
+        robin_hood: linear, but a new key takes the slot of a key that is
+            closer to its home slot, which then moves on
+    Table sizes need not be powers of two, so double probing steps by an
+    amount coprime with the size, and quadratic probing walks its offsets
+    modulo the next power of two, skipping the slots past the end of the
+    table. Either way every slot is visited before any slot is visited
+    twice.
+    '''
+
+    def __init__(self, cells, defval, too_full=TOO_FULL,
+                 growth_ratio=GROWTH_RATIO, probing="linear"):
+        '''
+        Construct a new compact hash table with a fixed number of cells
+
+        Inputs:
+            cells (int): the initial length of the hash table
+            defval (str): the value that needs to be returned when key is not found
+            too_full (float): the load factor above which the table grows
+            growth_ratio (int): how many times larger the table gets
+            probing (str): the probing scheme, one of PROBING
+        '''
+        if probing not in PROBING:
+            raise ValueError("probing must be one of " + ", ".join(PROBING))
+        check_growth(too_full, growth_ratio)
+
+        self.hashes = array('q', [EMPTY]) * cells
+        self.keys = [None] * cells
+        self.values = [None] * cells
+        self.defval = defval
+        self.counter = 0
+        self.too_full = too_full
+        self.growth_ratio = growth_ratio
+        self.resizes = 0
+        self.probing = probing
+        self.search = getattr(self, "search_" + probing)
+
+    def size(self):
+        '''
+        Returns the number of cells of the hash table
+        '''
+        return len(self.hashes)
+
+    def items(self):
+        '''
+        Yields every (key, value) pair stored in the hash table
+        '''
+        for i, hash in enumerate(self.hashes):
+            if hash != EMPTY:
+                yield self.keys[i], self.values[i]
+
+    def hashed_items(self):
+        '''
+        Yields every (key, value, hash) triple stored in the hash table,
+        with the stored full hash of the key
+        '''
+        for i, hash in enumerate(self.hashes):
+            if hash != EMPTY:
+                yield self.keys[i], self.values[i], hash
+
+    def hashing(self, s):
+        '''
+        Takes in a string and returns its full (size independent) hash value
+
+        Inputs:
+            s (str): the string
+
+        Returns:
+            (int) hash value
+        '''
+        return hash_string(s)
+
+    def lookup(self, key, hash=None):
+        '''
+        Retrieve the value associated with the specified key in the hash table,
+        or return the default value if it has not previously been inserted.
+
+        Inputs:
+            key (str): the key that wants to be looked up
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            (str) value if found, else default value
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+        if self.hashes[index] != hash:
+            return self.defval
+        else:
+            return self.values[index]
+
+    def update(self, key, val, hash=None):
+        '''
+        Change the value associated with key "key" to value "val".
+        If "key" is not currently present in the hash table, insert it with
+        value "val".
+
+        Inputs:
+            key (str): the key
+            val (str): the value associated with the key
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+
+        if self.hashes[index] != hash:
+            self.insert(index, hash, key, val)
+        else:
+            self.values[index] = val
+
+    def increment(self, key, delta=1, hash=None):
+        '''
+        Adds "delta" to the value associated with key "key" with a single
+        probe, treating a missing key as having the default value
+
+        Inputs:
+            key (str): the key
+            delta (int): the amount to add
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+
+        if self.hashes[index] != hash:
+            self.insert(index, hash, key, self.defval + delta)
+        else:
+            self.values[index] += delta
+
+    def insert(self, index, hash, key, val):
+        '''
+        Stores a new key at slot "index" and grows the table if it becomes
+        too full
+
+        Inputs:
+            index (int): the slot returned by find_index for the key
+            hash (int): the full hash value of the key
+            key (str): the key
+            val (str): the value associated with the key
+
+        Returns:
+            None, updates hash table in place
+        '''
+        self.place(index, hash, key, val)
+        self.counter += 1
+
+        if self.counter / len(self.hashes) > self.too_full:
+            self.rehashing()
+
+    def place(self, index, hash, key, val):
+        '''
+        Writes a key that is not in the table at slot "index", as returned by
+        find_index. With Robin Hood probing the slot may be taken, and the
+        keys from there on are shifted along their probe sequence.
+
+        Inputs:
+            index (int): the slot returned by find_index for the key
+            hash (int): the full hash value of the key
+            key (str): the key
+            val (str): the value associated with the key
+
+        Returns:
+            None, updates hash table in place
+        '''
+        hashes, keys, values = self.hashes, self.keys, self.values
+
+        if self.probing == "robin_hood":
+            cells = len(hashes)
+            while hashes[index] != EMPTY:
+                stored = hashes[index]
+                if (index - stored) % cells < (index - hash) % cells:
+                    hashes[index], hash = hash, stored
+                    keys[index], key = key, keys[index]
+                    values[index], val = val, values[index]
+                index += 1
+                if index == cells:
+                    index = 0
+
+        hashes[index] = hash
+        keys[index] = key
+        values[index] = val
+
+    def write(self, f):
+        '''
+        Writes the table to a binary file in the layout read back by
+        Mapped_Hash_Table: a header, then the hashes, values and key
+        offsets as native int64 arrays, then the UTF-8 encoded keys.
+        Values must be integers.
+
+        Inputs:
+            f (file): a file opened for writing in binary mode
+
+        Returns:
+            None
+        '''
+        encoded = []
+        offsets = array('q', [0])
+        values = array('q', [0]) * len(self.hashes)
+        total = 0
+
+        for i, hash in enumerate(self.hashes):
+            if hash != EMPTY:
+                key = self.keys[i].encode("utf-8")
+                encoded.append(key)
+                total += len(key)
+                values[i] = self.values[i]
+            offsets.append(total)
+
+        f.write(TABLE_HEADER.pack(len(self.hashes), self.counter, total,
+                                  PROBING.index(self.probing)))
+        f.write(self.hashes.tobytes())
+        f.write(values.tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+
+    def find_index(self, key, hash):
+        '''
+        Returns index that corresponds to a key if it already exists,
+        or the index of the slot where it should be inserted. The key is
+        present if and only if the hash stored at that index is its hash.
+
+        Inputs:
+            key (str): the key
+            hash (int): the full hash value of the key
+
+        Returns:
+            (int) the index
+        '''
+        return self.search(self.hashes, self.keys, key, hash)
+
+    def search_linear(self, hashes, keys, key, hash):
+        '''
+        Linear probing version of find_index, over the given arrays.
+        The keys are only compared when the stored hash matches.
+        '''
+        cells = len(hashes)
+        index = hash % cells
+        wrapped = False
+
+        while True:
+            stored = hashes[index]
+            if stored == EMPTY:
+                return index
+            if stored == hash and keys[index] == key:
+                return index
+            index += 1
+            if index == cells:
+                # Wrapping a second time means every slot was visited
+                if wrapped:
+                    break
+                wrapped = True
+                index = 0
+
+        raise Table_Full_Error("no empty slot in a table of {} cells"
+                               .format(cells))
+
+    def search_robin_hood(self, hashes, keys, key, hash):
+        '''
+        Robin Hood version of find_index, over the given arrays. The search
+        stops early at a key that is closer to its home slot than the
+        searched key would be, since the searched key would have taken
+        that slot.
+        '''
+        cells = len(hashes)
+        index = hash % cells
+        distance = 0
+
+        while distance < cells:
+            stored = hashes[index]
+            if stored == EMPTY:
+                return index
+            if stored == hash and keys[index] == key:
+                return index
+            if stored >= 0 and (index - stored) % cells < distance:
+                return index
+            distance += 1
+            index += 1
+            if index == cells:
+                index = 0
+
+        raise Table_Full_Error("no empty slot in a table of {} cells"
+                               .format(cells))
+
+    def search_quadratic(self, hashes, keys, key, hash):
+        '''
+        Quadratic probing version of find_index, over the given arrays
+        '''
+        for index in self.probe_sequence(hash, len(hashes)):
+            stored = hashes[index]
+            if stored == EMPTY or (stored == hash and keys[index] == key):
+                return index
+
+        raise Table_Full_Error("no empty slot in a table of {} cells"
+                               .format(len(hashes)))
+
+    search_double = search_quadratic
+
+    def probe_sequence(self, hash, cells):
+        '''
+        Yields the slots visited for a hash in a table with "cells" slots
+
+        Inputs:
+            hash (int): the full hash value of the key
+            cells (int): the length of the table
+
+        Yields:
+            (int) indices
+        '''
+        index = hash % cells
+
+        if self.probing == "quadratic":
+            # Triangular offsets reach every slot of a power of two sized
+            # range, and the slots past the end of the table are skipped
+            mask = (1 << (cells - 1).bit_length()) - 1
+            for step in range(mask + 1):
+                if index < cells:
+                    yield index
+                index = (index + step + 1) & mask
+            return
+
+        step = 1
+        if self.probing == "double" and cells > 1:
+            step = 1 + (hash * HASH_MIX % HASH_MODULUS) % (cells - 1)
+            while math.gcd(step, cells) != 1:
+                step += 1
+
+        for _ in range(cells):
+            yield index
+            index = (index + step) % cells
+
+    def probe_lengths(self):
+        '''
+        Yields, for every stored key, the number of slots that are probed
+        to find it
+        '''
+        cells = len(self.hashes)
+        for i, hash in enumerate(self.hashes):
+            if hash >= 0:
+                for probes, index in enumerate(self.probe_sequence(hash,
+                                                                   cells), 1):
+                    if index == i:
+                        yield probes
+                        break
+
+    def occupied(self):
+        '''
+        Returns a list telling, for every slot, whether it holds a key
+        '''
+        return [hash >= 0 for hash in self.hashes]
+
+    def rehashing(self):
+        '''
+        Increases the size of the hash table and moves every entry to its
+        new slot using the stored hashes
+
+        Inputs:
+            None
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        self.resize(self.growth_ratio * len(self.hashes))
+
+    def resize(self, cells):
+        '''
+        Replaces the arrays by ones with the given number of cells and moves
+        every entry to its new slot using the stored hashes
+
+        Inputs:
+            cells (int): the new length of the hash table
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        old_hashes, old_keys, old_values = self.hashes, self.keys, self.values
+
+        self.hashes = hashes = array('q', [EMPTY]) * cells
+        self.keys = keys = [None] * cells
+        self.values = values = [None] * cells
+        self.resizes += 1
+
+        for i, hash in enumerate(old_hashes):
+            if hash == EMPTY:
+                continue
+            if self.probing != "linear":
+                key = old_keys[i]
+                self.place(self.find_index(key, hash), hash, key,
+                           old_values[i])
+                continue
+
+            index = hash % cells
+            while hashes[index] != EMPTY:
+                index += 1
+                if index == cells:
+                    index = 0
+            hashes[index] = hash
+            keys[index] = old_keys[i]
+            values[index] = old_values[i]
+
+
+class Incremental_Hash_Table(Compact_Hash_Table):
+    '''
+    Compact hash table that resizes incrementally. When it grows, the old
+    arrays are kept next to the new ones and every lookup and update moves
+    a few old slots, so no single operation has to reinsert the whole
+    table. The number of slots is set at each resize so that the old
+    arrays are empty before the next resize, even if every operation
+    inserts a new key, and is at least MIGRATE_STEP.
+    '''
+
+    def __init__(self, cells, defval, too_full=TOO_FULL,
+                 growth_ratio=GROWTH_RATIO, probing="linear"):
+        '''
+        Construct a new incrementally resized hash table
+
+        Inputs:
+            cells (int): the initial length of the hash table
+            defval (str): the value that needs to be returned when key is not found
+            too_full (float): the load factor above which the table grows
+            growth_ratio (int): how many times larger the table gets
+            probing (str): the probing scheme, one of PROBING
+        '''
+        super().__init__(cells, defval, too_full, growth_ratio, probing)
+        self.old_hashes = None
+        self.old_keys = None
+        self.old_values = None
+        self.migrate_index = 0
+        self.migrate_step = MIGRATE_STEP
+
+    def lookup(self, key, hash=None):
+        '''
+        Retrieve the value associated with the specified key, looking in the
+        old arrays too if a resize is in progress
+
+        Inputs:
+            key (str): the key that wants to be looked up
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            (str) value if found, else default value
+        '''
+        self.migrate(self.migrate_step)
+
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+        if self.hashes[index] == hash:
+            return self.values[index]
+
+        old_index = self.find_old_index(key, hash)
+        if old_index is not None:
+            return self.old_values[old_index]
+
+        return self.defval
+
+    def update(self, key, val, hash=None):
+        '''
+        Change the value associated with key "key" to value "val", or insert
+        it. A key that is still in the old arrays is moved to the new ones.
+
+        Inputs:
+            key (str): the key
+            val (str): the value associated with the key
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        self.migrate(self.migrate_step)
+
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+
+        if self.hashes[index] == hash:
+            self.values[index] = val
+            return
+
+        old_index = self.find_old_index(key, hash)
+        if old_index is None:
+            self.insert(index, hash, key, val)
+        else:
+            self.move(old_index, index, val)
+
+    def increment(self, key, delta=1, hash=None):
+        '''
+        Adds "delta" to the value associated with key "key", treating a
+        missing key as having the default value. A key that is still in the
+        old arrays is moved to the new ones.
+
+        Inputs:
+            key (str): the key
+            delta (int): the amount to add
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        self.migrate(self.migrate_step)
+
+        if hash is None:
+            hash = hash_string(key)
+        index = self.find_index(key, hash)
+
+        if self.hashes[index] == hash:
+            self.values[index] += delta
+            return
+
+        old_index = self.find_old_index(key, hash)
+        if old_index is None:
+            self.insert(index, hash, key, self.defval + delta)
+        else:
+            self.move(old_index, index, self.old_values[old_index] + delta)
+
+    def move(self, old_index, index, val):
+        '''
+        Moves the key in slot "old_index" of the old arrays to slot "index"
+        of the new arrays with value "val"
+
+        Inputs:
+            old_index (int): the slot of the key in the old arrays
+            index (int): the slot returned by find_index for the key
+            val (str): the value associated with the key
+
+        Returns:
+            None, updates hash table in place
+        '''
+        self.place(index, self.old_hashes[old_index],
+                   self.old_keys[old_index], val)
+        self.old_hashes[old_index] = MOVED
+
+    def find_old_index(self, key, hash):
+        '''
+        Returns the index of a key in the old arrays, skipping the slots
+        that have already been moved
+
+        Inputs:
+            key (str): the key
+            hash (int): the full hash value of the key
+
+        Returns:
+            (int) the index, or None if the key is not in the old arrays
+        '''
+        if self.old_hashes is None:
+            return None
+
+        try:
+            index = self.search(self.old_hashes, self.old_keys, key, hash)
+        except Table_Full_Error:
+            # The old arrays can fill up just before the resize
+            return None
+        if self.old_hashes[index] != hash:
+            return None
+        return index
+
+    def rehashing(self):
+        '''
+        Starts a resize: the current arrays become the old arrays and empty
+        arrays growth_ratio times larger take their place. A resize that is
+        still in progress is finished first.
+
+        Inputs:
+            None
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        self.finish_migration()
+
+        self.old_hashes, self.old_keys, self.old_values = (
+            self.hashes, self.keys, self.values)
+        cells = self.growth_ratio * len(self.old_hashes)
+
+        self.hashes = array('q', [EMPTY]) * cells
+        self.keys = [None] * cells
+        self.values = [None] * cells
+        self.migrate_index = 0
+        self.resizes += 1
+
+        # Keys that can be inserted before the next resize
+        inserts = max(1, int(self.too_full * cells) - self.counter + 1)
+        self.migrate_step = max(MIGRATE_STEP,
+                                -(-len(self.old_hashes) // inserts))
+
+    def resize(self, cells):
+        '''
+        Finishes any resize in progress, then replaces the arrays by ones
+        with the given number of cells all at once
+
+        Inputs:
+            cells (int): the new length of the hash table
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        self.finish_migration()
+        super().resize(cells)
+
+    def items(self):
+        '''
+        Finishes any resize in progress, then yields every (key, value) pair
+        stored in the hash table
+        '''
+        self.finish_migration()
+        return super().items()
+
+    def hashed_items(self):
+        '''
+        Finishes any resize in progress, then yields every (key, value,
+        hash) triple stored in the hash table
+        '''
+        self.finish_migration()
+        return super().hashed_items()
+
+    def write(self, f):
+        '''
+        Finishes any resize in progress, then writes the table to a binary
+        file in the layout read back by Mapped_Hash_Table
+
+        Inputs:
+            f (file): a file opened for writing in binary mode
+
+        Returns:
+            None
+        '''
+        self.finish_migration()
+        super().write(f)
+
+    def finish_migration(self):
+        '''
+        Moves every entry left in the old arrays into the new ones
+
+        Inputs:
+            None
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        if self.old_hashes is not None:
+            self.migrate(len(self.old_hashes))
+
+    def migrate(self, steps):
+        '''
+        Moves the entries of the next "steps" slots of the old arrays into
+        the new ones, and drops the old arrays once they are all moved
+
+        Inputs:
+            steps (int): the number of old slots to visit
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        old_hashes = self.old_hashes
+        if old_hashes is None:
+            return
+
+        start = self.migrate_index
+        end = min(start + steps, len(old_hashes))
+
+        for i in range(start, end):
+            hash = old_hashes[i]
+            if hash >= 0:
+                key = self.old_keys[i]
+                self.place(self.find_index(key, hash), hash, key,
+                           self.old_values[i])
+
+        self.migrate_index = end
+        if end == len(old_hashes):
+            self.old_hashes = None
+            self.old_keys = None
+            self.old_values = None
+
+
+class Mapped_Keys:
+    '''
+    Read-only sequence of the keys of a saved table, decoded from the
+    buffer one at a time when they are accessed. Empty slots are told
+    apart by their hash, since the empty string is a valid key.
+    '''
+
+    def __init__(self, hashes, offsets, key_bytes):
+        '''
+        Inputs:
+            hashes (memoryview): the hash of each slot's key
+            offsets (memoryview): start of each slot's key, plus the end
+            key_bytes (memoryview): the UTF-8 encoded keys
+        '''
+        self.hashes = hashes
+        self.offsets = offsets
+        self.key_bytes = key_bytes
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if self.hashes[index] == EMPTY:
+            return None
+        start = self.offsets[index]
+        end = self.offsets[index + 1]
+        return str(self.key_bytes[start:end], "utf-8")
+
+
+class Mapped_Hash_Table(Compact_Hash_Table):
+    '''
+    Read-only compact hash table whose arrays are views into a buffer
+    holding a table saved with Compact_Hash_Table.write, typically a
+    memory-mapped file. Opening it does not copy or rehash any entry.
+    '''
+
+    def __init__(self, buffer, offset=0, defval=0):
+        '''
+        Construct a hash table over a saved table
+
+        Inputs:
+            buffer (buffer): the bytes of the saved table, e.g. an mmap
+            offset (int): position of the table inside the buffer
+            defval (int): the value that needs to be returned when key is not found
+        '''
+        cells, counter, key_bytes, probing = TABLE_HEADER.unpack_from(buffer,
+                                                                      offset)
+        view = memoryview(buffer)
+        start = offset + TABLE_HEADER.size
+        width = 8 * cells
+
+        self.hashes = view[start:start + width].cast('q')
+        self.values = view[start + width:start + 2 * width].cast('q')
+        start += 2 * width
+        self.offsets = view[start:start + width + 8].cast('q')
+        start += width + 8
+        self.key_bytes = view[start:start + key_bytes]
+        self.keys = Mapped_Keys(self.hashes, self.offsets,
+                                self.key_bytes)
+        self.defval = defval
+        self.counter = counter
+        self.too_full = TOO_FULL
+        self.growth_ratio = GROWTH_RATIO
+        self.resizes = 0
+        self.probing = PROBING[probing]
+        self.search = getattr(self, "search_" + self.probing)
+
+    def insert(self, index, hash, key, val):
+        '''
+        Mapped tables cannot grow
+        '''
+        raise TypeError("a mapped hash table is read-only")
+
+    def to_compact(self):
+        '''
+        Returns an in-memory Compact_Hash_Table holding every pair
+        '''
+        table = Compact_Hash_Table(len(self.hashes), self.defval,
+                                   probing=self.probing)
+        for i, hash in enumerate(self.hashes):
+            if hash >= 0:
+                table.increment(self.keys[i], self.values[i], hash)
+        return table
+
+    def write(self, f):
+        '''
+        Writes the table to a binary file in the same layout it was read from
+
+        Inputs:
+            f (file): a file opened for writing in binary mode
+
+        Returns:
+            None
+        '''
+        f.write(TABLE_HEADER.pack(len(self.hashes), self.counter,
+                                  len(self.key_bytes),
+                                  PROBING.index(self.probing)))
+        f.write(self.hashes)
+        f.write(self.values)
+        f.write(self.offsets)
+        f.write(self.key_bytes)
+
+
+class Concurrent_Hash_Table:
+    '''
+    Thread-safe hash table made of SHARDS compact tables, each guarded by
+    its own lock. A key always goes to the shard picked by a scrambled copy
+    of its hash, so threads working on different shards never wait for
+    each other, and a shard that grows only blocks the keys of that shard.
+    '''
+
+    def __init__(self, cells, defval, shards=SHARDS, **options):
+        '''
+        Construct a new concurrent hash table
+
+        Inputs:
+            cells (int): the initial length of each shard
+            defval (str): the value that needs to be returned when key is not found
+            shards (int): the number of shards
+            options: too_full, growth_ratio and probing of the shards
+        '''
+        self.defval = defval
+        self.shards = [Compact_Hash_Table(cells, defval, **options)
+                       for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def shard_index(self, hash):
+        '''
+        Returns the number of the shard that holds the keys with this hash
+        '''
+        return (hash * HASH_MIX % HASH_MODULUS) % len(self.shards)
+
+    def lookup(self, key, hash=None):
+        '''
+        Retrieve the value associated with the specified key in the hash table,
+        or return the default value if it has not previously been inserted.
+
+        Inputs:
+            key (str): the key that wants to be looked up
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            (str) value if found, else default value
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        shard = self.shard_index(hash)
+
+        with self.locks[shard]:
+            return self.shards[shard].lookup(key, hash)
+
+    def update(self, key, val, hash=None):
+        '''
+        Change the value associated with key "key" to value "val", or insert
+        it if it is not present
+
+        Inputs:
+            key (str): the key
+            val (str): the value associated with the key
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        shard = self.shard_index(hash)
+
+        with self.locks[shard]:
+            self.shards[shard].update(key, val, hash)
+
+    def increment(self, key, delta=1, hash=None):
+        '''
+        Atomically adds "delta" to the value associated with key "key",
+        treating a missing key as having the default value
+
+        Inputs:
+            key (str): the key
+            delta (int): the amount to add
+            hash (int): the full hash value of the key, if already known
+
+        Returns:
+            None, updates hash table in place
+        '''
+        if hash is None:
+            hash = hash_string(key)
+        shard = self.shard_index(hash)
+
+        with self.locks[shard]:
+            self.shards[shard].increment(key, delta, hash)
+
+    def update_many(self, pairs, size_hint=None):
+        '''
+        Updates the hash table with every (key, value) pair of an iterable,
+        taking the lock of each shard once
+
+        Inputs:
+            pairs (iterable): (key, value) tuples
+            size_hint (int): ignored, each shard is grown for its own pairs
+
+        Returns:
+            None, updates hash table in place
+        '''
+        batches = [[] for _ in self.shards]
+        for key, val in pairs:
+            batches[self.shard_index(hash_string(key))].append((key, val))
+
+        for shard, batch in enumerate(batches):
+            if batch:
+                with self.locks[shard]:
+                    self.shards[shard].update_many(batch)
+
+    def reserve(self, n):
+        '''
+        Grows every shard so that the table can hold "n" evenly spread keys
+        without having to rehash. All the locks are held during the resize.
+
+        Inputs:
+            n (int): the number of keys
+
+        Returns:
+            None, modifies hash table in place
+        '''
+        with self.all_locks():
+            per_shard = -(-n // len(self.shards))
+            for shard in self.shards:
+                shard.reserve(per_shard)
+
+    def all_locks(self):
+        '''
+        Returns a context manager that holds the locks of every shard,
+        always taken in the same order
+        '''
+        return All_Locks(self.locks)
+
+    def __len__(self):
+        '''
+        Returns the number of keys stored in the hash table
+        '''
+        return sum(len(shard) for shard in self.shards)
+
+    def size(self):
+        '''
+        Returns the total number of cells of the shards
+        '''
+        return sum(shard.size() for shard in self.shards)
+
+    def items(self):
+        '''
+        Returns the list of every (key, value) pair stored in the hash table,
+        as a consistent snapshot
+        '''
+        with self.all_locks():
+            return [pair for shard in self.shards for pair in shard.items()]
+
+    def hashed_items(self):
+        '''
+        Returns the list of every (key, value, hash) triple stored in the
+        hash table, as a consistent snapshot
+        '''
+        with self.all_locks():
+            return [triple for shard in self.shards
+                    for triple in shard.hashed_items()]
+
+    def merge(self, other):
+        '''
+        Adds the values of another hash table to the values of this one
+
+        Inputs:
+            other (Hash_Table): any hash table
+
+        Returns:
+            None, updates hash table in place
+        '''
+        for key, val in other.items():
+            self.increment(key, val)
+
+    def to_compact(self):
+        '''
+        Returns a Compact_Hash_Table holding a snapshot of every pair
+        '''
+        table = Compact_Hash_Table(self.shards[0].size(), self.defval)
+        table.update_many(self.items())
+        return table
+
+    def write(self, f):
+        '''
+        Writes a snapshot of the table to a binary file in the layout read
+        back by Mapped_Hash_Table
+
+        Inputs:
+            f (file): a file opened for writing in binary mode
+
+        Returns:
+            None
+        '''
+        self.to_compact().write(f)
+
+
+class All_Locks:
+    '''
+    Context manager that takes a list of locks in order and releases them
+    in reverse order
+    '''
+
+    def __init__(self, locks):
+        self.locks = locks
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self.locks):
+            lock.release()
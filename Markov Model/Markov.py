@@ -1,22 +1,88 @@
 # CS122 W'21: Markov models and hash tables
 # Rhedintza Audryna
 
+import os
 import sys
 import math
+import mmap
+import struct
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import Hash_Table
+from Hash_Table import HASH_BASE, HASH_MODULUS
+
+# Multiplying by the inverse of the base drops the last character of a
+# rolling hash
+HASH_BASE_INVERSE = pow(HASH_BASE, -1, HASH_MODULUS)
 
 HASH_CELLS = 57
+CHUNK_SIZE = 1 << 20
+MODEL_MAGIC = b"MARKOV02"
+# magic, order, number of unique characters and length of the encoded
+# characters of a saved model
+MODEL_HEADER = struct.Struct("=8sqqq")
+
+
+def rolling_kgrams(s, k):
+    '''
+    Walks over string "s" (wrapping around at the start) and yields, for
+    every character, its preceding context and the context followed by the
+    character, together with their hash values. Each hash is derived from
+    the previous one in constant time.
+
+    Inputs:
+        s (str): the string
+        k (int): the order of the model
+
+    Yields:
+        tuples (prev, prev_hash, seq, seq_hash)
+    '''
+    prev = s[-k:]
+    return window_kgrams(prev + s, len(prev))
+
+
+def window_kgrams(text, width):
+    '''
+    Same as rolling_kgrams without the wraparound: yields the contexts of
+    the characters of "text" that come after its first "width" characters
+
+    Inputs:
+        text (str): the string
+        width (int): the length of the contexts
+
+    Yields:
+        tuples (prev, prev_hash, seq, seq_hash)
+    '''
+    prev = text[:width]
+    codes = [ord(char) for char in text]
+    high = pow(HASH_BASE, width, HASH_MODULUS)
+    prev_hash = Hash_Table.hash_string(prev)
+
+    for i in range(width, len(text)):
+        seq = text[i - width:i + 1]
+        seq_hash = (prev_hash * HASH_BASE + codes[i]) % HASH_MODULUS
+        yield prev, prev_hash, seq, seq_hash
+
+        prev = seq[1:]
+        prev_hash = (seq_hash - codes[i - width] * high) % HASH_MODULUS
 
 
 class Markov:
 
-    def __init__(self, k, s):
+    def __init__(self, k, s, incremental=False):
         '''
-        Construct a new k-order Markov model using the statistics of string "s"
+        Construct a new k-order Markov model using the statistics of string
+        "s". With "incremental", the counts are kept in an
+        Incremental_Hash_Table, so learning never pauses to rehash them.
         '''
         self.k = k
-        self.table = Hash_Table.Hash_Table(HASH_CELLS, 0)
-        self.unique_chars = len(set(s))
+        if incremental:
+            self.table = Hash_Table.Incremental_Hash_Table(HASH_CELLS, 0)
+        else:
+            self.table = Hash_Table.Compact_Hash_Table(HASH_CELLS, 0)
+        self.chars = set()
+        self.unique_chars = 0
+        self.log_table = None
         self.learn(s)
 
     def learn(self, s):
@@ -30,16 +96,167 @@ class Markov:
         Returns:
             None, modifies the model in place
         '''
+        self.add_chars(s)
+        self.count(rolling_kgrams(s, self.k))
+
+    def add_chars(self, chars):
+        '''
+        Adds characters to the alphabet of the model
+
+        Inputs:
+            chars (iterable): the characters
+
+        Returns:
+            None, modifies the model in place
+        '''
+        self.chars.update(chars)
+        self.unique_chars = len(self.chars)
+
+    def count(self, kgrams):
+        '''
+        Adds one to the counts of every context and context followed by a
+        character produced by rolling_kgrams or window_kgrams
+
+        Inputs:
+            kgrams (iterable): tuples (prev, prev_hash, seq, seq_hash)
+
+        Returns:
+            None, modifies the model in place
+        '''
+        self.unmap_table()
+        increment = self.table.increment
+        self.log_table = None
+
+        for prev, prev_hash, seq, seq_hash in kgrams:
+            increment(prev, 1, prev_hash)
+            increment(seq, 1, seq_hash)
+
+    def learn_stream(self, f, chunk_size=CHUNK_SIZE):
+        '''
+        Same as learn, for text read from a file "chunk_size" characters at
+        a time. Only the first and last k characters are kept between chunks:
+        contexts that cross a chunk boundary use the last k characters of
+        the previous chunk, and the first k characters are counted at the
+        end, once the last k characters (their wraparound context) are known.
+
+        Inputs:
+            f (file): a file opened in text mode
+            chunk_size (int): number of characters to read at a time
+
+        Returns:
+            None, modifies the model in place
+        '''
+        k = self.k
+        if k < 1:
+            raise ValueError("learn_stream needs an order of at least 1")
+
+        head = None
+        buffer = ""
+
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            self.add_chars(chunk)
+            text = buffer + chunk
+
+            if head is None and len(text) < k:
+                buffer = text
+                continue
+            if head is None:
+                head = text[:k]
+
+            self.count(window_kgrams(text, k))
+            buffer = text[-k:]
+
+        if head is None:
+            # The whole text is shorter than k
+            self.learn(buffer)
+        else:
+            self.count(window_kgrams(buffer + head, k))
+
+    @classmethod
+    def from_stream(cls, k, f, chunk_size=CHUNK_SIZE, incremental=False):
+        '''
+        Construct a new k-order Markov model using the statistics of the text
+        in file "f", without reading the whole file into memory
+
+        Inputs:
+            k (int): the order of the model
+            f (file): a file opened in text mode
+            chunk_size (int): number of characters to read at a time
+            incremental (bool): resize the counts table incrementally
+
+        Returns:
+            Markov model
+        '''
+        model = cls(k, "", incremental)
+        model.learn_stream(f, chunk_size)
+        return model
+
+    @classmethod
+    def from_shards(cls, k, texts, threads=None):
+        '''
+        Construct a new k-order Markov model from several texts, learned at
+        the same time by a pool of threads into one Concurrent_Hash_Table.
+        Each text wraps around on its own, as if learn were called on each
+        text in turn. The threads only count k-grams: the alphabet is
+        gathered once they are done, since add_chars is not thread safe.
+
+        Inputs:
+            k (int): the order of the model
+            texts (list of str): the texts
+            threads (int): number of threads, defaults to the executor's
+
+        Returns:
+            Markov model
+        '''
+        model = cls(k, "")
+        model.table = Hash_Table.Concurrent_Hash_Table(HASH_CELLS, 0)
+
+        def count_shard(text):
+            model.count(rolling_kgrams(text, k))
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(count_shard, texts))
+
+        for text in texts:
+            model.add_chars(text)
+        return model
+
+    def merge(self, other):
+        '''
+        Adds the counts and characters of another model of the same order
+        to this one, as if this model had also learned the other's texts
+
+        Inputs:
+            other (Markov): the other model
+
+        Returns:
+            None, modifies the model in place
+        '''
+        if other.k != self.k:
+            raise ValueError("cannot merge an order {} model into an order "
+                             "{} model".format(other.k, self.k))
 
-        prev = s[-self.k:]
+        self.unmap_table()
+        self.table.merge(other.table)
+        self.add_chars(other.chars)
+        self.log_table = None
 
-        for char in s:
-            self.table.update(prev, self.table.lookup(prev) + 1)
+    def unmap_table(self):
+        '''
+        Replaces a read-only memory-mapped table by an in-memory copy, so
+        the model can learn more text
 
-            seq = prev + char
-            self.table.update(seq, self.table.lookup(seq) + 1)
+        Inputs:
+            None
 
-            prev = seq[1:]
+        Returns:
+            None, modifies the model in place
+        '''
+        if isinstance(self.table, Hash_Table.Mapped_Hash_Table):
+            self.table = self.table.to_compact()
 
     def log_probability(self, s):
         '''
@@ -47,20 +264,361 @@ class Markov:
         character sequences modeled by this particular Markov model
         This probability is *not* normalized by the length of the string.
         '''
-
-        prev = s[-self.k:]
         all_prob = 0
 
-        for char in s:
-            seq = prev + char
-            seq_count = self.table.lookup(seq)
-            prev_count = self.table.lookup(prev)
-            prob = math.log((seq_count + 1) / (prev_count + self.unique_chars))
+        for prob in self.log_probabilities(s):
             all_prob += prob
-            prev = seq[1:]
 
         return all_prob
 
+    def log_probabilities(self, s):
+        '''
+        Yields the log probability of each character of string "s" given
+        its context. These add up to log_probability(s).
+
+        Log probabilities are computed from the counts the first time they
+        are needed and kept in a table: seen (k + 1)-grams map to their log
+        probability and seen contexts to the log probability of an unseen
+        character after them. Characters that were scored before then take
+        a single lookup and no call to math.log, and the table never holds
+        more keys than the model. Scoring a freshly trained or loaded model
+        costs about the same as counted_log_probabilities, whatever the
+        size of the model.
+        '''
+        if self.k < 1 or len(s) < self.k:
+            # Contexts are shorter than k, or do not all have the same length
+            yield from self.counted_log_probabilities(s)
+            return
+
+        if self.log_table is None:
+            self.log_table = Hash_Table.Compact_Hash_Table(HASH_CELLS, None)
+
+        lookup = self.log_table.lookup
+        update = self.log_table.update
+        count = self.table.lookup
+        unique_chars = self.unique_chars
+
+        for prev, prev_hash, seq, seq_hash in rolling_kgrams(s, self.k):
+            prob = lookup(seq, seq_hash)
+            if prob is not None:
+                yield prob
+                continue
+
+            seq_count = count(seq, seq_hash)
+            if seq_count:
+                prob = math.log((seq_count + 1) /
+                                (count(prev, prev_hash) + unique_chars))
+                update(seq, prob, seq_hash)
+                yield prob
+                continue
+
+            prob = lookup(prev, prev_hash)
+            if prob is None:
+                prev_count = count(prev, prev_hash)
+                prob = math.log(1 / (prev_count + unique_chars))
+                if prev_count:
+                    update(prev, prob, prev_hash)
+            yield prob
+
+    def build_log_table(self):
+        '''
+        Fills the table of log probabilities used by log_probabilities with
+        every (k + 1)-gram and context of the model at once, for a model
+        that will score a lot of text. The hash of the context of each
+        (k + 1)-gram is derived from the stored hash of the (k + 1)-gram.
+
+        Inputs:
+            None
+
+        Returns:
+            None, modifies the model in place
+        '''
+        lookup = self.table.lookup
+        log_table = Hash_Table.Compact_Hash_Table(HASH_CELLS, None)
+        log_table.reserve(len(self.table))
+
+        for key, count, hash in self.table.hashed_items():
+            if len(key) == self.k + 1:
+                prev_hash = ((hash - ord(key[-1])) * HASH_BASE_INVERSE
+                             % HASH_MODULUS)
+                prev_count = lookup(key[:-1], prev_hash)
+                log_table.update(key, math.log(
+                    (count + 1) / (prev_count + self.unique_chars)), hash)
+            elif len(key) == self.k:
+                log_table.update(key, math.log(
+                    1 / (count + self.unique_chars)), hash)
+
+        self.log_table = log_table
+
+    def counted_log_probabilities(self, s):
+        '''
+        Same as log_probabilities, computing each log probability from the
+        counts of the model
+        '''
+        lookup = self.table.lookup
+
+        for prev, prev_hash, seq, seq_hash in rolling_kgrams(s, self.k):
+            seq_count = lookup(seq, seq_hash)
+            prev_count = lookup(prev, prev_hash)
+            yield math.log((seq_count + 1) / (prev_count + self.unique_chars))
+
+    def save(self, filename):
+        '''
+        Saves the order, characters and k-gram counts of the model to a
+        binary file that can be memory-mapped by load
+
+        Inputs:
+            filename (str): name of the model file
+
+        Returns:
+            None
+        '''
+        chars = "".join(sorted(self.chars)).encode("utf-8")
+        # Pad the characters so the table arrays stay 8-byte aligned
+        padding = -(MODEL_HEADER.size + len(chars)) % 8
+
+        # The table may be a memory map of the file itself, so the model is
+        # written to a temporary file that then replaces it
+        temporary = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temporary, "wb") as f:
+            f.write(MODEL_HEADER.pack(MODEL_MAGIC, self.k, self.unique_chars,
+                                      len(chars)))
+            f.write(chars + bytes(padding))
+            self.table.write(f)
+        os.replace(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Opens a model saved with save. The file is memory-mapped and its
+        counts are looked up in place, so loading takes the same time
+        whatever the size of the model. The table is copied into memory if
+        the model learns more text.
+
+        Inputs:
+            filename (str): name of the model file
+
+        Returns:
+            Markov model
+        '''
+        with open(filename, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, k, unique_chars, chars_length = MODEL_HEADER.unpack_from(
+            buffer, 0)
+        if magic != MODEL_MAGIC:
+            raise ValueError(filename + " is not a saved Markov model")
+
+        start = MODEL_HEADER.size
+        end = start + chars_length
+        padding = -end % 8
+
+        model = cls.__new__(cls)
+        model.k = k
+        model.chars = set(buffer[start:end].decode("utf-8"))
+        model.unique_chars = unique_chars
+        model.table = Hash_Table.Mapped_Hash_Table(buffer, end + padding)
+        model.log_table = None
+        return model
+
+
+def train_parallel(k, texts, processes=None):
+    '''
+    Trains one k-order model per text in a pool of worker processes and
+    merges them into a single model
+
+    Inputs:
+        k (int): the order of the model
+        texts (list of str): the texts, for example parts of one corpus
+        processes (int): number of worker processes, defaults to the
+            number of CPUs
+
+    Returns:
+        Markov model
+    '''
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        models = list(pool.map(Markov, [k] * len(texts), texts))
+
+    model = Markov(k, "")
+    for other in models:
+        model.merge(other)
+    return model
+
+
+def is_saved_model(filename):
+    '''
+    Returns True if the file starts like a model written by Markov.save
+    '''
+    with open(filename, "rb") as f:
+        return f.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+
+
+def load_or_train(filename, order):
+    '''
+    Returns the model saved in "filename", or a new model of the given
+    order trained on the text in "filename"
+    '''
+    if is_saved_model(filename):
+        model = Markov.load(filename)
+        if model.k != order:
+            raise ValueError("{} holds an order {} model, not order {}"
+                             .format(filename, model.k, order))
+        return model
+
+    with open(filename, "r") as f:
+        return Markov.from_stream(order, f)
+
+
+def suffix_kgrams(text, n, start):
+    '''
+    For every character of "text" from index "start" on, yields the
+    1-gram to n-gram that end with it (shorter near the beginning of the
+    text) with their hash values. Each gram's hash is derived from the
+    one of the gram before it in constant time.
+
+    Inputs:
+        text (str): the string
+        n (int): length of the longest gram
+        start (int): index of the first character
+
+    Yields:
+        lists of (gram, hash) tuples, shortest gram first
+    '''
+    codes = [ord(char) for char in text]
+    powers = [pow(HASH_BASE, j, HASH_MODULUS) for j in range(n)]
+
+    for i in range(start, len(text)):
+        grams = []
+        hash = 0
+        for j in range(min(n, i + 1)):
+            hash = (hash + codes[i - j] * powers[j]) % HASH_MODULUS
+            grams.append((text[i - j:i + 1], hash))
+        yield grams
+
+
+class Multi_Order_Markov:
+    '''
+    Markov models of every order from 1 to max_k, trained in a single pass.
+    A k-gram count is the same whether the k-gram is used as the context
+    of an order k model or as the context followed by a character of an
+    order k - 1 model, so all orders share one table holding the counts of
+    every 1-gram to (max_k + 1)-gram. Texts that are learned or scored
+    must be at least max_k characters long: a shorter text wraps around
+    into contexts shorter than the order.
+    '''
+
+    def __init__(self, max_k, s):
+        '''
+        Construct Markov models of orders 1 to max_k using the statistics
+        of string "s"
+        '''
+        self.max_k = max_k
+        self.table = Hash_Table.Compact_Hash_Table(HASH_CELLS, 0)
+        self.chars = set()
+        self.unique_chars = 0
+        self.models = {}
+        self.learn(s)
+
+    def learn(self, s):
+        '''
+        Counts every 1-gram to (max_k + 1)-gram of "s", wrapping around
+        at the start
+
+        Inputs:
+            s (str): the string, empty or at least max_k characters long
+
+        Returns:
+            None, modifies the model in place
+        '''
+        if 0 < len(s) < self.max_k:
+            raise ValueError("texts must be at least {} characters long"
+                             .format(self.max_k))
+
+        self.chars.update(s)
+        self.unique_chars = len(self.chars)
+        # The cached models hold log probabilities of the old counts
+        self.models = {}
+        increment = self.table.increment
+        prefix = s[-self.max_k:]
+
+        for grams in suffix_kgrams(prefix + s, self.max_k + 1, len(prefix)):
+            for gram, hash in grams:
+                increment(gram, 1, hash)
+
+    def model(self, k):
+        '''
+        Returns an order k Markov model that shares the counts of this one.
+        The model is kept until the next call to learn, so its cached log
+        probabilities are reused across calls.
+
+        Inputs:
+            k (int): the order, from 1 to max_k
+
+        Returns:
+            Markov model
+        '''
+        if not 1 <= k <= self.max_k:
+            raise ValueError("order must be between 1 and {}"
+                             .format(self.max_k))
+
+        model = self.models.get(k)
+        if model is None:
+            model = Markov.__new__(Markov)
+            model.k = k
+            model.table = self.table
+            model.chars = self.chars
+            model.unique_chars = self.unique_chars
+            model.log_table = None
+            self.models[k] = model
+        return model
+
+    def log_probability(self, s, k=None):
+        '''
+        Get the log probability of string "s" under the order k model, or
+        the list of its log probabilities under every order if k is None.
+        These probabilities are *not* normalized by the length of the string.
+        '''
+        if k is not None:
+            if len(s) < k:
+                raise ValueError("texts must be at least {} characters long"
+                                 .format(k))
+            return self.model(k).log_probability(s)
+
+        return self.log_probability_all(s)
+
+    def log_probability_all(self, s):
+        '''
+        Get the log probabilities of string "s" under the models of orders
+        1 to max_k in a single pass: the counts of the grams ending at one
+        character are the contexts of the next character.
+
+        Inputs:
+            s (str): the string, at least max_k characters long
+
+        Returns:
+            list of floats, the log probability for order k at index k - 1
+        '''
+        if len(s) < self.max_k:
+            raise ValueError("texts must be at least {} characters long"
+                             .format(self.max_k))
+
+        lookup = self.table.lookup
+        prefix = s[-(self.max_k + 1):]
+        all_probs = [0] * self.max_k
+        prev_counts = None
+
+        for grams in suffix_kgrams(prefix + s, self.max_k + 1,
+                                   len(prefix) - 1):
+            counts = [lookup(gram, hash) for gram, hash in grams]
+            if prev_counts is not None:
+                for k in range(1, self.max_k + 1):
+                    all_probs[k - 1] += math.log(
+                        (counts[k] + 1) / (prev_counts[k - 1] +
+                                           self.unique_chars))
+            prev_counts = counts
+
+        return all_probs
+
 
 def identify_speaker(speech1, speech2, speech3, order):
     '''
@@ -75,6 +633,13 @@ def identify_speaker(speech1, speech2, speech3, order):
     model_1 = Markov(order, speech1)
     model_2 = Markov(order, speech2)
 
+    return compare_models(model_1, model_2, speech3)
+
+
+def compare_models(model_1, model_2, speech3):
+    '''
+    Same as identify_speaker, for two already trained (or loaded) models
+    '''
     length = len(speech3)
     prob_1 = model_1.log_probability(speech3) / length
     prob_2 = model_2.log_probability(speech3) / length
@@ -87,6 +652,133 @@ def identify_speaker(speech1, speech2, speech3, order):
     return (prob_1, prob_2, likely)
 
 
+def score_speech(speech, speech3, order):
+    '''
+    Trains a model on "speech" and returns the normalized log probability
+    of "speech3" under it. Runs in a worker process.
+    '''
+    model = Markov(order, speech)
+    return model.log_probability(speech3) / len(speech3)
+
+
+def score_file(filename, speech3, order):
+    '''
+    Same as score_speech, for a text or saved model stored in a file
+    '''
+    model = load_or_train(filename, order)
+    return model.log_probability(speech3) / len(speech3)
+
+
+def rank_speakers(speakers, speech3, order, processes=None,
+                  scorer=score_speech):
+    '''
+    Given sample text from any number of speakers, and text from an
+    unidentified speaker, trains and scores one model per speaker in a
+    pool of worker processes and ranks the speakers by the *normalized*
+    log probability of them uttering that text.
+
+    Inputs:
+        speakers (dict): maps each speaker name to its sample text
+            (or, with scorer=score_file, to the name of its file)
+        speech3 (str): the text to identify
+        order (int): order of the Markov models
+        processes (int): number of worker processes, defaults to the
+            number of CPUs
+        scorer (function): function that scores one speaker
+
+    Returns:
+        list of (name, normalized log probability) tuples, most likely first
+    '''
+    names = list(speakers)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(scorer, speakers[name], speech3, order)
+                   for name in names]
+        probs = [future.result() for future in futures]
+
+    return sorted(zip(names, probs), key=lambda pair: pair[1], reverse=True)
+
+
+def segment_speakers(models, speech3, window, step=None):
+    '''
+    Slides a window of "window" characters over text from an unidentified
+    speaker, "step" characters at a time, and finds the most likely
+    speaker of each window. Each model makes one pass over the text to
+    build prefix sums of the per-character log probabilities, so each
+    window then costs O(1) per model.
+
+    Inputs:
+        models (dict): maps each speaker name to a trained Markov model
+        speech3 (str): the text to identify
+        window (int): number of characters in a window
+        step (int): distance between the starts of consecutive windows,
+            defaults to half the window
+
+    Returns:
+        list of (start, end, name, probs) tuples, one per window, where
+        probs maps each speaker name to its *normalized* log probability.
+        The last window ends at the end of the text.
+    '''
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    if step is None:
+        step = max(1, window // 2)
+    if step < 1:
+        raise ValueError("step must be at least 1")
+    if not speech3:
+        return []
+    window = min(window, len(speech3))
+
+    prefix_sums = {name: list(accumulate(model.log_probabilities(speech3),
+                                         initial=0))
+                   for name, model in models.items()}
+
+    starts = list(range(0, len(speech3) - window + 1, step))
+    if starts[-1] + window < len(speech3):
+        # Cover the characters after the last full step
+        starts.append(len(speech3) - window)
+
+    segments = []
+    for start in starts:
+        end = start + window
+        probs = {name: (sums[end] - sums[start]) / window
+                 for name, sums in prefix_sums.items()}
+        segments.append((start, end, max(probs, key=probs.get), probs))
+
+    return segments
+
+
+def speaker_timeline(segments):
+    '''
+    Merges consecutive windows from segment_speakers that have the same
+    most likely speaker
+
+    Returns:
+        list of (start, end, name) tuples
+    '''
+    timeline = []
+
+    for start, end, name, _ in segments:
+        if timeline and timeline[-1][2] == name:
+            timeline[-1] = (timeline[-1][0], end, name)
+        else:
+            timeline.append((start, end, name))
+
+    return timeline
+
+
+def print_ranking(ranking):
+    '''
+    Given a list from rank_speakers, print formatted results to the screen
+    '''
+    for rank, (name, likelihood) in enumerate(ranking, 1):
+        print("{:3}. {}: {}".format(rank, name, likelihood))
+
+    print("")
+
+    print("Conclusion: " + ranking[0][0] + " is most likely")
+
+
 def print_results(res_tuple):
     '''
     Given a tuple from identify_speaker, print formatted results to the screen
@@ -104,21 +796,84 @@ def print_results(res_tuple):
 if __name__ == "__main__":
     num_args = len(sys.argv)
 
+    if num_args == 5 and sys.argv[1] == "--save":
+        with open(sys.argv[2], "r") as file1:
+            Markov.from_stream(int(sys.argv[3]), file1).save(sys.argv[4])
+        sys.exit(0)
+
+    if num_args >= 4 and sys.argv[1] == "--add":
+        try:
+            model = Markov.load(sys.argv[2])
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        for filename in sys.argv[3:]:
+            with open(filename, "r") as file1:
+                model.learn_stream(file1)
+        model.save(sys.argv[2])
+        sys.exit(0)
+
+    if num_args >= 5 and sys.argv[1] == "--rank":
+        with open(sys.argv[2], "r") as file3:
+            speech3 = file3.read()
+        speakers = {filename: filename for filename in sys.argv[4:]}
+
+        try:
+            ranking = rank_speakers(speakers, speech3, int(sys.argv[3]),
+                                    scorer=score_file)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        print_ranking(ranking)
+        sys.exit(0)
+
+    if num_args >= 6 and sys.argv[1] == "--segment":
+        with open(sys.argv[2], "r") as file3:
+            speech3 = file3.read()
+        order = int(sys.argv[3])
+
+        try:
+            models = {filename: load_or_train(filename, order)
+                      for filename in sys.argv[5:]}
+            segments = segment_speakers(models, speech3, int(sys.argv[4]))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        for start, end, name in speaker_timeline(segments):
+            print("{:>10} - {:<10} {}".format(start, end, name))
+        sys.exit(0)
+
     if num_args != 5:
         print("usage: python3 " + sys.argv[0] + " <file name for speaker A> " +
               "<file name for speaker B>\n  <file name of text to identify> " +
-              "<order>")
+              "<order>\n" +
+              "       python3 " + sys.argv[0] + " --save <file name of text>" +
+              " <order> <model file name>\n" +
+              "       python3 " + sys.argv[0] + " --add <model file name> " +
+              "<file name of text> ...\n" +
+              "       python3 " + sys.argv[0] + " --rank <file name of text " +
+              "to identify> <order>\n  <speaker file name> ...\n" +
+              "       python3 " + sys.argv[0] + " --segment <file name of " +
+              "text to identify> <order>\n  <window size> " +
+              "<speaker file name> ...\n" +
+              "Speaker files can be texts or models saved with --save")
         sys.exit(0)
 
-    with open(sys.argv[1], "r") as file1:
-        speech1 = file1.read()
+    order = int(sys.argv[4])
 
-    with open(sys.argv[2], "r") as file2:
-        speech2 = file2.read()
+    try:
+        model_1 = load_or_train(sys.argv[1], order)
+        model_2 = load_or_train(sys.argv[2], order)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
 
     with open(sys.argv[3], "r") as file3:
         speech3 = file3.read()
 
-    res_tuple = identify_speaker(speech1, speech2, speech3, int(sys.argv[4]))
+    res_tuple = compare_models(model_1, model_2, speech3)
 
     print_results(res_tuple)
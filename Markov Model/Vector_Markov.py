@@ -0,0 +1,124 @@
+# CS122 W'21: Markov models and hash tables
+# Vectorized NumPy backend for the Markov model
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Vector_Markov:
+    '''
+    k-order Markov model with the same statistics and log probabilities as
+    Markov.Markov, but trained and scored with whole-array NumPy operations
+    instead of a loop over the characters.
+
+    Characters are mapped to small integer ids, and each k-gram is encoded
+    as a base "len(alphabet) + 1" number, with a leading digit 1 so that
+    grams of different lengths never share an id. Contexts and contexts
+    followed by a character are counted together, like the keys of the
+    table of Markov.Markov, so texts shorter than k (whose contexts are
+    shorter) get the same log probabilities as there. Id len(alphabet) is
+    reserved for characters that never appear in the training text.
+    '''
+
+    def __init__(self, k, s):
+        '''
+        Construct a new k-order Markov model using the statistics of string "s"
+        '''
+        if np is None:
+            raise ImportError("Vector_Markov requires numpy")
+
+        self.k = k
+        self.alphabet = np.unique(self.encode(s))
+        self.unique_chars = len(self.alphabet)
+        self.base = self.unique_chars + 1
+        self.learn(s)
+
+    @staticmethod
+    def encode(s):
+        '''
+        Returns the array of code points of string "s"
+        '''
+        return np.frombuffer(s.encode("utf-32-le"), dtype="<u4")
+
+    def kgram_ids(self, s):
+        '''
+        Encodes, for every character of "s" (wrapping around at the start),
+        its preceding context and the context followed by the character
+
+        Inputs:
+            s (str): the string
+
+        Returns:
+            (prev_ids, seq_ids) two int64 arrays of length len(s)
+        '''
+        width = len(s[-self.k:])
+        if 2 * self.base ** (width + 1) >= 2 ** 63:
+            raise ValueError("order {} is too large for an alphabet of {} "
+                             "characters".format(self.k, self.unique_chars))
+
+        codes = self.encode(s[-self.k:] + s)
+        index = np.minimum(np.searchsorted(self.alphabet, codes),
+                           self.unique_chars - 1)
+        ids = np.where(self.alphabet[index] == codes, index,
+                       self.unique_chars).astype(np.int64)
+
+        windows = np.lib.stride_tricks.sliding_window_view(ids, width + 1)
+        powers = self.base ** np.arange(width, -1, -1, dtype=np.int64)
+        seq_ids = windows @ powers + self.base ** (width + 1)
+        prev_ids = seq_ids // self.base
+
+        return prev_ids, seq_ids
+
+    def learn(self, s):
+        '''
+        Collects the counts of every context and every context followed by
+        a character, as a sorted array of ids and their counts
+
+        Inputs:
+            s (str): the string
+
+        Returns:
+            None, modifies the model in place
+        '''
+        prev_ids, seq_ids = self.kgram_ids(s)
+        self.keys, self.counts = np.unique(np.concatenate((prev_ids, seq_ids)),
+                                           return_counts=True)
+
+    @staticmethod
+    def counts_of(keys, counts, ids):
+        '''
+        Looks up the counts of many ids at once in sorted (keys, counts)
+        arrays, using 0 for the ids that are not present
+
+        Returns:
+            int64 array with one count per id
+        '''
+        if len(keys) == 0:
+            return np.zeros(len(ids), dtype=np.int64)
+
+        index = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+        return np.where(keys[index] == ids, counts[index], 0)
+
+    def log_probability(self, s):
+        '''
+        Get the log probability of string "s", given the statistics of
+        character sequences modeled by this particular Markov model
+        This probability is *not* normalized by the length of the string.
+        '''
+        return float(np.sum(self.log_probabilities(s)))
+
+    def log_probabilities(self, s):
+        '''
+        Returns the array of the log probabilities of each character of
+        string "s" given its context
+        '''
+        if not s:
+            return np.zeros(0)
+
+        prev_ids, seq_ids = self.kgram_ids(s)
+        seq_count = self.counts_of(self.keys, self.counts, seq_ids)
+        prev_count = self.counts_of(self.keys, self.counts, prev_ids)
+
+        return np.log((seq_count + 1) / (prev_count + self.unique_chars))
@@ -0,0 +1,596 @@
+# CS122 W'21: Markov models and hash tables
+# Benchmarks and profiling for the hash tables and Markov models
+
+import os
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import platform
+import subprocess
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import Hash_Table
+import Markov
+import Vector_Markov
+
+HASH_CELLS = 57
+LAYOUTS = {"tuple": Hash_Table.Hash_Table,
+           "compact": Hash_Table.Compact_Hash_Table,
+           "incremental": Hash_Table.Incremental_Hash_Table}
+PERCENTILES = [50, 99, 99.9, 100]
+WORDS = ["the", "of", "and", "to", "in", "a", "is", "that", "for", "it",
+         "as", "was", "with", "be", "by", "on", "not", "he", "this", "are",
+         "people", "government", "country", "America", "freedom", "today",
+         "will", "we", "our", "must", "can", "every", "nation", "years."]
+SUITE_SIZES = [20000, 200000]
+SUITE_ORDERS = [1, 3, 6]
+SUITE_LAYOUTS = ["tuple", "compact"]
+PROFILE_LINES = 20
+
+
+def make_keys(n, length, seed=0):
+    '''
+    Build a list of random lowercase keys of a fixed length
+
+    Inputs:
+        n (int): number of keys
+        length (int): length of each key
+        seed (int): seed for the random generator
+
+    Returns:
+        list of strings
+    '''
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz "
+    return ["".join(rng.choice(letters) for _ in range(length))
+            for _ in range(n)]
+
+
+def make_text(n, seed=0):
+    '''
+    Build a synthetic speech of about n characters out of common words
+
+    Inputs:
+        n (int): number of characters
+        seed (int): seed for the random generator
+
+    Returns:
+        string
+    '''
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < n:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:n]
+
+
+def fill(table_class, keys):
+    '''
+    Insert every key into a new table of the given class
+
+    Inputs:
+        table_class (class): hash table class to build
+        keys (list of str): keys to insert
+
+    Returns:
+        the filled table
+    '''
+    table = table_class(HASH_CELLS, 0)
+    for i, key in enumerate(keys):
+        table.update(key, i)
+    return table
+
+
+def measure_memory(table_class, keys):
+    '''
+    Returns the number of bytes allocated while building the table,
+    not counting the keys themselves
+    '''
+    tracemalloc.start()
+    table = fill(table_class, keys)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return current
+
+
+def measure_ops(table_class, keys):
+    '''
+    Returns a tuple with the update and lookup rates (ops/sec) of the table
+    '''
+    start = time.perf_counter()
+    table = fill(table_class, keys)
+    update_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in keys:
+        table.lookup(key)
+    lookup_time = time.perf_counter() - start
+
+    return (len(keys) / update_time, len(keys) / lookup_time)
+
+
+def compare_layouts(n, length):
+    '''
+    Print memory and ops/sec of every table layout for n keys
+    '''
+    keys = make_keys(n, length)
+    print("{} keys of length {}".format(n, length))
+    for name, table_class in LAYOUTS.items():
+        memory = measure_memory(table_class, keys)
+        updates, lookups = measure_ops(table_class, keys)
+        print("  {:12} {:10.1f} KiB {:12.0f} updates/s {:12.0f} lookups/s"
+              .format(name, memory / 1024, updates, lookups))
+
+
+def update_latencies(table_class, keys):
+    '''
+    Returns the sorted list of the times (in seconds) taken by each update
+    while filling a new table with the keys
+    '''
+    table = table_class(HASH_CELLS, 0)
+    clock = time.perf_counter
+    latencies = []
+
+    for i, key in enumerate(keys):
+        start = clock()
+        table.update(key, i)
+        latencies.append(clock() - start)
+
+    latencies.sort()
+    return latencies
+
+
+def percentile(sorted_values, p):
+    '''
+    Returns the p-th percentile of an already sorted list
+    '''
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def compare_latencies(n, length):
+    '''
+    Print update latency percentiles (in microseconds) of every table
+    layout for growing numbers of keys up to n
+    '''
+    all_keys = make_keys(n, length)
+    print("update latency (us) for keys of length {}".format(length))
+    print("  {:12} {:>8} ".format("layout", "keys") +
+          " ".join("{:>9}".format("p" + str(p)) for p in PERCENTILES))
+
+    size = max(1000, n // 8)
+    while True:
+        keys = all_keys[:size]
+        for name, table_class in LAYOUTS.items():
+            latencies = update_latencies(table_class, keys)
+            print("  {:12} {:8} ".format(name, size) +
+                  " ".join("{:9.1f}".format(percentile(latencies, p) * 1e6)
+                           for p in PERCENTILES))
+        if size >= n:
+            break
+        size = min(n, size * 2)
+
+
+def compare_backends(n, max_order):
+    '''
+    Print training and scoring times of the pure Python and NumPy Markov
+    models on a synthetic text of n characters, for orders 1 to max_order
+    '''
+    if Vector_Markov.np is None:
+        print("numpy is not installed")
+        return
+
+    train = make_text(n, seed=1)
+    unknown = make_text(n // 4, seed=2)
+    print("training on {} characters, scoring {} characters"
+          .format(len(train), len(unknown)))
+    print("  {:>5} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "order", "learn", "score", "np learn", "np score", "speedup"))
+
+    for order in range(1, max_order + 1):
+        times = []
+        results = []
+        for model_class in (Markov.Markov, Vector_Markov.Vector_Markov):
+            start = time.perf_counter()
+            model = model_class(order, train)
+            middle = time.perf_counter()
+            results.append(model.log_probability(unknown))
+            times += [middle - start, time.perf_counter() - middle]
+
+        assert abs(results[0] - results[1]) <= 1e-9 * abs(results[0])
+        print("  {:5} {:9.3f}s {:9.3f}s {:9.3f}s {:9.3f}s {:7.1f}x".format(
+            order, *times, (times[0] + times[1]) / (times[2] + times[3])))
+
+
+def compare_scoring(n, order):
+    '''
+    Print the scoring throughput (characters/sec) of a Markov model trained
+    on n characters, computing log probabilities from the counts and
+    looking them up in the cached log probability table
+    '''
+    model = Markov.Markov(order, make_text(n, seed=1))
+    unknown = make_text(n, seed=2)
+    print("order {} model trained on {} characters".format(order, n))
+
+    start = time.perf_counter()
+    counted = 0
+    for prob in model.counted_log_probabilities(unknown):
+        counted += prob
+    counted_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.build_log_table()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cached = model.log_probability(unknown)
+    cached_time = time.perf_counter() - start
+
+    assert counted == cached
+    print("  counts     {:12.0f} chars/s".format(n / counted_time))
+    print("  cached     {:12.0f} chars/s (table built in {:.3f}s)"
+          .format(n / cached_time, build_time))
+
+
+def compare_probing(n, order):
+    '''
+    Print the probe statistics and counting rate of compact tables using
+    each probing scheme and a few load factors, on the contexts of an
+    order "order" Markov model of a synthetic text of n characters
+    '''
+    text = make_text(n, seed=1)
+    kgrams = list(Markov.rolling_kgrams(text, order))
+    print("{} contexts of order {}".format(2 * len(kgrams), order))
+    print("  {:12} {:>5} {:>6} {:>6} {:>6} {:>8} {:>8} {:>8} {:>13}".format(
+        "probing", "load", "mean", "max", "mean", "max", "clusters",
+        "resizes", "increments/s"))
+    print("  {:12} {:>5} {:>6} {:>6} {:>6} {:>8}".format(
+        "", "", "probe", "probe", "clust", "cluster"))
+
+    for probing in Hash_Table.PROBING:
+        for too_full in (0.5, 0.7, 0.9):
+            table = Hash_Table.Compact_Hash_Table(HASH_CELLS, 0,
+                                                  too_full=too_full,
+                                                  probing=probing)
+            start = time.perf_counter()
+            for prev, prev_hash, seq, seq_hash in kgrams:
+                table.increment(prev, 1, prev_hash)
+                table.increment(seq, 1, seq_hash)
+            rate = 2 * len(kgrams) / (time.perf_counter() - start)
+
+            stats = table.probe_stats()
+            print("  {:12} {:5.1f} {:6.2f} {:6} {:6.2f} {:8} {:8} {:8} "
+                  "{:13.0f}".format(probing, too_full, stats["mean_probe"],
+                                    stats["max_probe"], stats["mean_cluster"],
+                                    stats["max_cluster"], stats["clusters"],
+                                    stats["resizes"], rate))
+
+
+def stress_concurrent(n, threads):
+    '''
+    Increment n random keys from "threads" threads at once in a concurrent
+    table and in a small starting table that has to grow many times, and
+    check that every final count is exact
+    '''
+    keys = make_keys(n, 2)
+    batches = [keys[i::threads] for i in range(threads)]
+    expected = Counter(keys)
+
+    table = Hash_Table.Concurrent_Hash_Table(2, 0)
+
+    def work(batch):
+        for key in batch:
+            table.increment(key)
+            table.update("last", key)
+
+    # Switch threads as often as possible to provoke races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(work, batches))
+    finally:
+        sys.setswitchinterval(interval)
+    elapsed = time.perf_counter() - start
+
+    counts = dict(table.items())
+    assert counts.pop("last") in batches_last(batches)
+    assert counts == expected, "counts differ under contention"
+    assert len(table) == len(expected) + 1
+
+    text = make_text(n, seed=1)
+    shards = [text[i:i + n // threads] for i in range(0, n, n // threads)]
+    model = Markov.Markov.from_shards(3, shards, threads)
+    reference = Markov.Markov(3, "")
+    for shard in shards:
+        reference.learn(shard)
+    assert dict(model.table.items()) == dict(reference.table.items())
+
+    print("{} increments from {} threads: exact counts, {:.0f} ops/s"
+          .format(n, threads, 2 * n / elapsed))
+
+
+def batches_last(batches):
+    '''
+    Returns the keys that can be the last one written by some thread
+    '''
+    return {batch[-1] for batch in batches if batch}
+
+
+def timed(function, *args):
+    '''
+    Calls function(*args) and returns a tuple with its result and the
+    number of seconds it took
+    '''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(function, *args):
+    '''
+    Calls function(*args) again with tracemalloc on, so the timings are
+    not slowed down, and returns the peak memory it allocated in KiB
+    '''
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def suite_corpora(filenames):
+    '''
+    Returns a list of (name, train text, unknown text) tuples for every
+    suite size: synthetic texts, and for each text file its first part
+    as training text and what follows as unknown text
+    '''
+    corpora = []
+
+    for size in SUITE_SIZES:
+        corpora.append(("synthetic", make_text(size, seed=1),
+                        make_text(size // 4, seed=2)))
+
+    for filename in filenames:
+        with open(filename, "r") as f:
+            text = f.read()
+        name = os.path.basename(filename)
+        for size in SUITE_SIZES:
+            if size + size // 4 <= len(text):
+                corpora.append((name, text[:size],
+                                text[size:size + size // 4]))
+
+    return corpora
+
+
+def bench_markov(name, train, unknown, order):
+    '''
+    Times the phases of a Markov model on one corpus and order
+
+    Returns:
+        dict of results
+    '''
+    model, learn_time = timed(Markov.Markov, order, train)
+    _, table_time = timed(model.build_log_table)
+    _, score_time = timed(model.log_probability, unknown)
+    stats = model.table.probe_stats()
+
+    return {"benchmark": "markov", "corpus": name, "size": len(train),
+            "order": order,
+            "learn_s": learn_time,
+            "learn_chars_per_s": len(train) / learn_time,
+            "log_table_s": table_time,
+            "score_s": score_time,
+            "score_chars_per_s": len(unknown) / score_time,
+            "peak_kib": peak_memory(Markov.Markov, order, train),
+            "keys": stats["keys"],
+            "mean_probe": stats["mean_probe"],
+            "max_probe": stats["max_probe"],
+            "resizes": stats["resizes"]}
+
+
+def bench_table(name, keys, layout):
+    '''
+    Times updates, lookups and one resize of a table layout on a list of
+    keys taken from a corpus
+
+    Returns:
+        dict of results
+    '''
+    table_class = LAYOUTS[layout]
+    table, update_time = timed(fill, table_class, keys)
+
+    start = time.perf_counter()
+    for key in keys:
+        table.lookup(key)
+    lookup_time = time.perf_counter() - start
+
+    stats = table.probe_stats()
+    _, resize_time = timed(table.resize, 2 * table.size())
+
+    return {"benchmark": "hash_table", "corpus": name, "size": len(keys),
+            "layout": layout,
+            "update_s": update_time,
+            "updates_per_s": len(keys) / update_time,
+            "lookup_s": lookup_time,
+            "lookups_per_s": len(keys) / lookup_time,
+            "resize_s": resize_time,
+            "peak_kib": peak_memory(fill, table_class, keys),
+            "mean_probe": stats["mean_probe"],
+            "max_probe": stats["max_probe"],
+            "resizes": stats["resizes"]}
+
+
+def run_suite(filenames):
+    '''
+    Runs every suite benchmark and prints one line per result
+
+    Inputs:
+        filenames (list of str): text files to use next to synthetic texts
+
+    Returns:
+        list of result dicts
+    '''
+    results = []
+
+    for name, train, unknown in suite_corpora(filenames):
+        keys = [seq for _, _, seq, _ in Markov.rolling_kgrams(train, 3)]
+        for layout in SUITE_LAYOUTS:
+            result = bench_table(name, keys, layout)
+            results.append(result)
+            print("  {:20} {:8} {:12} {:10.0f} updates/s {:10.0f} lookups/s"
+                  " {:9.1f} KiB".format(name, len(keys), layout,
+                                        result["updates_per_s"],
+                                        result["lookups_per_s"],
+                                        result["peak_kib"]))
+
+        for order in SUITE_ORDERS:
+            result = bench_markov(name, train, unknown, order)
+            results.append(result)
+            print("  {:20} {:8} order {:<6} {:10.0f} learn/s   {:10.0f} "
+                  "score/s   {:9.1f} KiB".format(name, len(train), order,
+                                                 result["learn_chars_per_s"],
+                                                 result["score_chars_per_s"],
+                                                 result["peak_kib"]))
+
+    return results
+
+
+def current_commit():
+    '''
+    Returns the git commit of the working tree, or None outside of git
+    '''
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def suite(results_file, filenames, profile_file=None):
+    '''
+    Runs the benchmark suite, optionally under cProfile, and saves the
+    results to a JSON file that compare_results can read back
+
+    Inputs:
+        results_file (str): name of the JSON file to write
+        filenames (list of str): text files to use next to synthetic texts
+        profile_file (str): name of the cProfile stats file, if any
+
+    Returns:
+        None
+    '''
+    random.seed(0)
+
+    if profile_file:
+        profiler = cProfile.Profile()
+        results = profiler.runcall(run_suite, filenames)
+        profiler.dump_stats(profile_file)
+        pstats.Stats(profile_file).sort_stats("cumulative").print_stats(
+            PROFILE_LINES)
+    else:
+        results = run_suite(filenames)
+
+    with open(results_file, "w") as f:
+        json.dump({"commit": current_commit(),
+                   "python": platform.python_version(),
+                   "profiled": bool(profile_file),
+                   "results": results}, f, indent=2)
+
+
+def result_key(result):
+    '''
+    Returns what identifies a result across runs
+    '''
+    return (result["benchmark"], result["corpus"], result["size"],
+            result.get("layout"), result.get("order"))
+
+
+def compare_results(old_file, new_file):
+    '''
+    Print, for every result found in both JSON files written by suite, how
+    many times faster (or smaller) the new run is for each metric
+    '''
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+
+    print("{} -> {} (higher is better)".format(old["commit"], new["commit"]))
+    old_results = {result_key(result): result for result in old["results"]}
+
+    for result in new["results"]:
+        before = old_results.get(result_key(result))
+        if before is None:
+            continue
+
+        ratios = []
+        for metric, value in result.items():
+            if not isinstance(value, float) or not before.get(metric):
+                continue
+            if metric.endswith("_per_s"):
+                ratios.append("{} {:.2f}x".format(metric,
+                                                  value / before[metric]))
+            elif metric == "peak_kib" and value:
+                ratios.append("memory {:.2f}x".format(before[metric] / value))
+
+        label = " ".join(str(part) for part in result_key(result)
+                         if part is not None)
+        print("  {:45} {}".format(label, ", ".join(ratios)))
+
+
+if __name__ == "__main__":
+    num_args = len(sys.argv)
+    modes = {"layouts": (compare_layouts, 100000, 5),
+             "latency": (compare_latencies, 100000, 5),
+             "backends": (compare_backends, 1000000, 6),
+             "scoring": (compare_scoring, 1000000, 3),
+             "probing": (compare_probing, 1000000, 3),
+             "stress": (stress_concurrent, 200000, 8)}
+
+    if num_args > 2 and sys.argv[1] == "suite":
+        args = sys.argv[3:]
+        profile_file = None
+        if args[:1] == ["--profile"] and len(args) > 1:
+            profile_file = args[1]
+            args = args[2:]
+        suite(sys.argv[2], args, profile_file)
+        sys.exit(0)
+
+    if num_args == 4 and sys.argv[1] == "compare":
+        compare_results(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    if num_args > 4 or (num_args > 1 and sys.argv[1] not in modes):
+        print("usage: python3 " + sys.argv[0] + " [layouts|latency] " +
+              "[<number of keys>] [<key length>]\n" +
+              "       python3 " + sys.argv[0] + " backends " +
+              "[<text length>] [<max order>]\n" +
+              "       python3 " + sys.argv[0] + " scoring|probing " +
+              "[<text length>] [<order>]\n" +
+              "       python3 " + sys.argv[0] + " stress " +
+              "[<number of increments>] [<threads>]\n" +
+              "       python3 " + sys.argv[0] + " suite <results file> " +
+              "[--profile <stats file>] [<text file> ...]\n" +
+              "       python3 " + sys.argv[0] + " compare <old results file> " +
+              "<new results file>")
+        sys.exit(0)
+
+    mode = sys.argv[1] if num_args > 1 else "layouts"
+    function, first, second = modes[mode]
+    if num_args > 2:
+        first = int(sys.argv[2])
+    if num_args > 3:
+        second = int(sys.argv[3])
+
+    function(first, second)